@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Profile the test suite and explore where the wall-clock time goes
+
+Runs pytest with --report-log (pytest-reportlog) and opens the result in
+pytest-duration-insights. Re-run after each fixture/parametrize refactor
+and work on the slowest bucket first.
+"""
+import subprocess
+import sys
+
+REPORT_LOG = "reportlog.jsonl"
+
+def main():
+    result = subprocess.run([sys.executable, "-m", "pytest", f"--report-log={REPORT_LOG}", "-q", *sys.argv[1:]])
+    if result.returncode not in (0, 1):
+        # 0: all passed, 1: some tests failed; anything else means no usable report
+        sys.exit(result.returncode)
+
+    try:
+        subprocess.run(["pytest-duration-insights", "explore", REPORT_LOG], check=True)
+    except FileNotFoundError:
+        print("pytest-duration-insights not found. Install the dev dependencies to explore the report.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,8 @@ def install_node(state: UpgradeWorkflowState) -> dict:
     console.print(f"  [blue]Installing {pkg['name']}=={pkg['target_version']} (trial)...[/blue]")
 
     pm = PackageManager(project_root)
-    success = pm.install(pkg["name"], pkg["target_version"], update_manifest=False)
+    # Single version bump: skip the resolver and validate with 'pip check' instead
+    success = pm.install(pkg["name"], pkg["target_version"], update_manifest=False, no_deps=True)
 
     if success:
         console.print("  [green]Trial installation successful[/green]")
@@ -1,3 +1,4 @@
+import re
 import tomli
 from typing import List
 from pathlib import Path
@@ -50,7 +51,6 @@ class PyProjectParser(BaseParser):
         return dependencies
 
     def _parse_standard_dep(self, dep_str: str) -> Dependency:
-        import re
         # Simple extraction similar to requirements.txt
         match = re.match(r'^([a-zA-Z0-9_\-\.]+)(.*)$', dep_str)
         if not match:
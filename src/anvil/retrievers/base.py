@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Optional
 
@@ -18,3 +19,10 @@ class BaseRetriever(ABC):
         Retrieves the source code repository URL (e.g. GitHub).
         """
         pass
+
+    async def aget_changelog(self, package_name: str, current_version: str, target_version: str) -> Optional[str]:
+        """
+        Async variant of get_changelog.
+        Runs the blocking lookup in a worker thread so many packages can be awaited together.
+        """
+        return await asyncio.to_thread(self.get_changelog, package_name, current_version, target_version)
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from pathlib import Path
+from typing import Any, Dict, Optional
+from anvil.core.logging import get_logger
+
+logger = get_logger("retriever.cache")
+
+# Entries younger than this are served without touching the network.
+DEFAULT_MAX_AGE = 3600
+
+
+def default_cache_dir() -> Path:
+    """Resolves the HTTP cache location (ANVIL_CACHE_DIR, then XDG_CACHE_HOME, then ~/.cache)."""
+    override = os.getenv("ANVIL_CACHE_DIR")
+    if override:
+        return Path(override).expanduser() / "http"
+    xdg = os.getenv("XDG_CACHE_HOME")
+    base = Path(xdg).expanduser() if xdg else Path.home() / ".cache"
+    return base / "anvil" / "http"
+
+
+class HttpCache:
+    """
+    On-disk cache of GET responses, revalidated with ETag / Last-Modified.
+    A 304 from the server is answered from disk, and for GitHub it does not
+    count against the primary rate limit.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_age: int = DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_age = max_age
+
+    def get(self, session: requests.Session, url: str, headers: Optional[Dict[str, str]] = None, **kwargs: Any) -> requests.Response:
+        """Performs a cached GET through the given session."""
+        entry = self._load(url)
+        if entry and time.time() - entry["stored_at"] < self.max_age:
+            logger.debug(f"Cache hit (fresh): {url}")
+            return self._to_response(url, entry)
+
+        request_headers = dict(headers or {})
+        if entry:
+            if entry.get("etag"):
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        resp = session.get(url, headers=request_headers, **kwargs)
+
+        if resp.status_code == 304 and entry:
+            logger.debug(f"Cache hit (revalidated): {url}")
+            entry["stored_at"] = time.time()
+            self._store(url, entry, self._read_body(url))
+            return self._to_response(url, entry)
+
+        if resp.status_code == 200:
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+            if etag or last_modified:
+                self._store(url, {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "content_type": resp.headers.get("Content-Type"),
+                    "stored_at": time.time(),
+                }, resp.content)
+
+        return resp
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def _load(self, url: str) -> Optional[Dict[str, Any]]:
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return None
+        try:
+            return json.loads(meta_path.read_text())
+        except (OSError, ValueError) as e:
+            logger.debug(f"Ignoring unreadable cache entry for {url}: {e}")
+            return None
+
+    def _read_body(self, url: str) -> bytes:
+        return self._paths(url)[1].read_bytes()
+
+    def _store(self, url: str, meta: Dict[str, Any], body: bytes) -> None:
+        meta_path, body_path = self._paths(url)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial entry
+            for path, data in ((body_path, body), (meta_path, json.dumps(meta).encode("utf-8"))):
+                tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}-{threading.get_ident()}.tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug(f"Failed to write cache entry for {url}: {e}")
+
+    def _to_response(self, url: str, entry: Dict[str, Any]) -> requests.Response:
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp._content = self._read_body(url)
+        resp.encoding = "utf-8"
+        if entry.get("content_type"):
+            resp.headers["Content-Type"] = entry["content_type"]
+        if entry.get("etag"):
+            resp.headers["ETag"] = entry["etag"]
+        return resp
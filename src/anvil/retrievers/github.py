@@ -1,28 +1,102 @@
+import asyncio
+import functools
+import orjson
 import requests
 import base64
 import os
-from typing import Optional
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from packaging.version import InvalidVersion, Version, parse
 from anvil.retrievers.base import BaseRetriever
+from anvil.retrievers.cache import HttpCache
+from anvil.retrievers.ratelimit import TokenPool, get_rate_limiter
+from anvil.retrievers.session import get_session
 from anvil.core.logging import get_logger
 
 logger = get_logger("retriever.github")
 
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Changelogs are newest-first, so the head of the file normally covers the target version
+RAW_RANGE_BYTES = 65536
+# Changelog links in a README sit near the top (badges, a "Changelog" section)
+README_RANGE_BYTES = 16384
+
+# Standard changelog filenames, in lookup priority order
+CHANGELOG_FILENAMES = ["CHANGELOG.md", "History.md", "RELEASES.md", "CHANGES.md"]
+
+# Lowercased names matched against the repository tree, in priority order
+CHANGELOG_TREE_CANDIDATES = [
+    "changelog.md", "history.md", "releases.md", "changes.md",
+    "changelog.rst", "changes.rst", "history.rst", "news.md", "news.rst",
+    "changelog.txt", "changes.txt", "changelog",
+]
+
+# Markdown links whose text mentions 'change', 'history' or 'release': [Link Text](Link URL)
+_CHANGELOG_LINK_RE = re.compile(r'\[([^\]]*?(?:change|history|release)[^\]]*?)\]\(([^\)]+)\)', re.IGNORECASE)
+
+# Cheap prefilter for release tags: PEP 440 versions start with a digit (e.g. "1.2.0", "2.0rc1", "1!3.0+local")
+_VER_RE = re.compile(r"^\d+(?:\.\d+)*[A-Za-z0-9.!+_-]*$")
+
+@functools.lru_cache(maxsize=1024)
+def _parse_ver(version_str: str) -> Optional[Version]:
+    """Parses a version string once; returns None for non-versions."""
+    try:
+        return parse(version_str)
+    except InvalidVersion:
+        return None
+
 class GitHubRetriever(BaseRetriever):
     """Fetches changelogs from GitHub."""
     
-    def __init__(self, api_token: Optional[str] = None):
-        self.api_token = api_token or os.getenv("GITHUB_TOKEN")
-        if self.api_token:
+    def __init__(self, api_token: Optional[str] = None, api_tokens: Optional[List[str]] = None):
+        tokens = api_tokens or ([api_token] if api_token else self._tokens_from_env())
+        self._tokens = TokenPool(tokens)
+        self.api_token = tokens[0] if tokens else None
+        self._session = get_session()
+        self._cache = HttpCache()
+        self._rate_limiter = get_rate_limiter()
+        # repo_slug -> release list (None when the listing failed)
+        self._releases_cache: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+        # (repo_slug, path) -> file text prefetched via GraphQL (None when known to be missing)
+        self._blob_cache: Dict[Tuple[str, str], Optional[str]] = {}
+        # repo_slug -> default branch name (None when the lookup failed)
+        self._default_branch_cache: Dict[str, Optional[str]] = {}
+        # Per-thread flag set by sequential_probes()
+        self._local = threading.local()
+        if len(self._tokens) > 1:
+            logger.debug(f"GitHubRetriever initialized with a pool of {len(self._tokens)} API tokens")
+        elif self.api_token:
             logger.debug("GitHubRetriever initialized with API token")
         else:
             logger.debug("GitHubRetriever initialized without API token (unauthenticated)")
         
+    @staticmethod
+    def _tokens_from_env() -> List[str]:
+        """Reads GITHUB_TOKENS (comma-separated) followed by GITHUB_TOKEN."""
+        tokens = [t.strip() for t in os.getenv("GITHUB_TOKENS", "").split(",") if t.strip()]
+        single = os.getenv("GITHUB_TOKEN")
+        if single and single not in tokens:
+            tokens.append(single)
+        return tokens
+
     def get_source_url(self, package_name: str) -> Optional[str]:
         return None
 
+    async def aget_changelog(self, repo_slug: str, current_version: str, target_version: str, subdirectory: Optional[str] = None, package_name: Optional[str] = None) -> Optional[str]:
+        return await asyncio.to_thread(self.get_changelog, repo_slug, current_version, target_version, subdirectory, package_name)
+
     def get_changelog(self, repo_slug: str, current_version: str, target_version: str, subdirectory: Optional[str] = None, package_name: Optional[str] = None) -> Optional[str]:
         logger.debug(f"Fetching changelog for {repo_slug} (target: {target_version}, dir: {subdirectory}, pkg: {package_name})")
         
+        # 0. Prefetch releases, changelog files and README in a single GraphQL round-trip.
+        # The REST lookups below are served from memory when this succeeds.
+        if repo_slug not in self._releases_cache:
+            self._graphql_fetch(repo_slug, subdirectory)
+
         # 1. Try Fetching All Releases in Range
         # This is preferred as it gives full history
         full_history = self._fetch_all_releases_in_range(repo_slug, current_version, target_version, package_name)
@@ -38,7 +112,7 @@ class GitHubRetriever(BaseRetriever):
             
         # 2. Try CHANGELOG.md file content (standard names)
         logger.debug(f"No release notes found for {target_version}, trying CHANGELOG files...")
-        content = self._get_changelog_file(repo_slug, subdirectory)
+        content = self._get_changelog_file(repo_slug, subdirectory, target_version=target_version)
         if content:
             return content
 
@@ -46,32 +120,164 @@ class GitHubRetriever(BaseRetriever):
         logger.debug("No standard changelog file found. Scanning README for links...")
         return self._scan_readme_for_changelog(repo_slug, subdirectory)
 
-    def _get_headers(self):
+    def _get_headers(self, token: Optional[str] = None):
+        token = token or self._tokens.pick()
         headers = {"Accept": "application/vnd.github.v3+json"}
-        if self.api_token:
-            headers["Authorization"] = f"Bearer {self.api_token}"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
         return headers
 
+    def _send(self, do_request: Callable[[Dict[str, str]], requests.Response]) -> requests.Response:
+        """
+        Sends a request through the rate limiter using the token with the most budget left.
+        When that token hits a rate limit and another one still has budget, the request is
+        re-sent with the next token instead of waiting.
+        """
+        for _ in range(max(len(self._tokens), 1)):
+            token = self._tokens.pick()
+            rotated = False
+
+            def rotate(resp: requests.Response) -> bool:
+                nonlocal rotated
+                rotated = self._tokens.update(token, resp)
+                return rotated
+
+            resp = self._rate_limiter.request(lambda: do_request(self._get_headers(token)), token=token, rotate=rotate)
+            if not rotated:
+                break
+            logger.debug(f"GitHub token rate limited ({resp.status_code}), rotating to the next token")
+        return resp
+
+    def _get(self, url: str, timeout: int = 5) -> requests.Response:
+        """Cached, rate-limited GET against the GitHub API."""
+        return self._send(lambda headers: self._cache.get(self._session, url, headers=headers, timeout=timeout))
+
+    def _post(self, url: str, payload: Dict[str, Any], timeout: int = 10) -> requests.Response:
+        """Rate-limited POST against the GitHub API."""
+        return self._send(lambda headers: self._session.post(url, json=payload, headers=headers, timeout=timeout))
+
+    def _graphql_fetch(self, repo_slug: str, subdirectory: Optional[str] = None) -> bool:
+        """
+        Fetches releases, changelog candidates and README in one GraphQL query.
+        Populates the in-memory caches and returns True on success.
+        GitHub's GraphQL API requires authentication, so this is skipped without a token.
+        """
+        if not self.api_token:
+            return False
+
+        owner, _, name = repo_slug.partition("/")
+        prefix = f"{subdirectory}/" if subdirectory else ""
+        changelog_paths = [f"{prefix}{filename}" for filename in CHANGELOG_FILENAMES]
+        readme_path = f"{prefix}README.md"
+        paths = changelog_paths + [readme_path]
+
+        variables: Dict[str, str] = {"owner": owner, "name": name}
+        params = ["$owner: String!", "$name: String!"]
+        blob_fields = []
+        for i, path in enumerate(paths):
+            variables[f"f{i}"] = f"HEAD:{path}"
+            params.append(f"$f{i}: String!")
+            blob_fields.append(f"f{i}: object(expression: $f{i}) {{ ... on Blob {{ text }} }}")
+
+        query = (
+            f"query({', '.join(params)}) {{ repository(owner: $owner, name: $name) {{ "
+            "releases(first: 100, orderBy: {field: CREATED_AT, direction: DESC}) { nodes { tagName description } } "
+            f"{' '.join(blob_fields)} }} }}"
+        )
+
+        logger.debug(f"Fetching {repo_slug} via GraphQL")
+        try:
+            resp = self._post(GRAPHQL_URL, {"query": query, "variables": variables}, timeout=10)
+            if resp.status_code != 200:
+                logger.debug(f"GraphQL request failed: {resp.status_code}")
+                return False
+            payload = orjson.loads(resp.content)
+            if payload.get("errors"):
+                logger.debug(f"GraphQL returned errors: {payload['errors']}")
+                return False
+            repo = (payload.get("data") or {}).get("repository")
+            if not repo:
+                return False
+        except Exception as e:
+            logger.debug(f"GraphQL fetch failed, falling back to REST: {e}")
+            return False
+
+        self._releases_cache[repo_slug] = [
+            {"tag_name": node.get("tagName", ""), "body": node.get("description") or ""}
+            for node in (repo.get("releases") or {}).get("nodes") or []
+        ]
+        for i, path in enumerate(paths):
+            blob = repo.get(f"f{i}")
+            if blob is None:
+                # Missing changelog candidates are final; README may still exist under another name
+                if path != readme_path:
+                    self._blob_cache[(repo_slug, path)] = None
+            elif blob.get("text") is not None:
+                self._blob_cache[(repo_slug, path)] = blob["text"]
+        return True
+
+    @contextmanager
+    def sequential_probes(self) -> Iterator[None]:
+        """
+        Makes candidate lookups on the calling thread run one after another. For callers that
+        already run one lookup per pool worker (ChangelogRetriever.get_changelogs): a nested
+        pool per worker would outgrow the shared session's connection pool.
+        """
+        self._local.sequential = True
+        try:
+            yield
+        finally:
+            self._local.sequential = False
+
+    def _map(self, fn: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """Applies fn to items concurrently, or in order under sequential_probes()."""
+        if len(items) <= 1 or getattr(self._local, "sequential", False):
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=len(items)) as pool:
+            return list(pool.map(fn, items))
+
+    def _probe(self, urls: List[str], timeout: int = 5) -> Optional[requests.Response]:
+        """
+        Fires GET requests for all candidate URLs concurrently.
+        Returns the first 200 response in candidate order, or None.
+        """
+        if not urls:
+            return None
+
+        def fetch(url: str) -> Optional[requests.Response]:
+            try:
+                resp = self._get(url, timeout=timeout)
+            except requests.RequestException as e:
+                logger.debug(f"GitHub request failed for {url}: {e}")
+                return None
+            if resp.status_code != 200:
+                logger.debug(f"Lookup for {url} returned {resp.status_code}")
+            return resp
+
+        responses = self._map(fetch, urls)
+
+        for resp in responses:
+            if resp is not None and resp.status_code == 200:
+                return resp
+        return None
+
     def _fetch_all_releases_in_range(self, repo_slug: str, current_version: str, latest_version: str, package_name: Optional[str] = None) -> Optional[str]:
         """Fetches and aggregates all release notes strictly between current_version and latest_version."""
         try:
-            from packaging.version import parse
             current = parse(current_version)
             latest = parse(latest_version)
-        except ImportError:
-            logger.debug("packaging library not found, skipping version range checks")
+        except InvalidVersion:
+            logger.debug(f"Unparseable version range {current_version} -> {latest_version}, skipping range check")
             return None
             
-        url = f"https://api.github.com/repos/{repo_slug}/releases?per_page=100"
-        logger.debug(f"Fetching release history from {url}")
-        
+        releases = self._list_releases(repo_slug)
+        if not releases:
+            return None
+            
+        # Strip "package-name-" or "package-name@" or "package-name==" prefixes
+        prefixes = (f"{package_name}==", f"{package_name}@", f"{package_name}-v", f"{package_name}-") if package_name else ()
+
         try:
-            resp = requests.get(url, headers=self._get_headers(), timeout=10)
-            if resp.status_code != 200:
-                logger.debug(f"Failed to list releases: {resp.status_code}")
-                return None
-                
-            releases = resp.json()
             relevant_notes = []
             
             for release in releases:
@@ -80,27 +286,26 @@ class GitHubRetriever(BaseRetriever):
                 
                 # Parse version from tag
                 version_str = tag_name
-                # Strip known prefixes
-                if version_str.startswith("v"):
+                # Strip known prefixes, then a leading "v"/"V" ("V1.2.0", "pkg-V1.2.0")
+                for prefix in prefixes:
+                    stripped = version_str.removeprefix(prefix)
+                    if len(stripped) != len(version_str):
+                        version_str = stripped
+                        break
+                if version_str[:1] in ("v", "V"):
                     version_str = version_str[1:]
-                elif package_name:
-                    # Strip "package-name-" or "package-name@" or "package-name==" prefixes
-                    prefixes = [f"{package_name}==", f"{package_name}@", f"{package_name}-v", f"{package_name}-"]
-                    for prefix in prefixes:
-                        if version_str.startswith(prefix):
-                            version_str = version_str[len(prefix):]
-                            break
                 
-                try:
-                    rel_ver = parse(version_str)
-                    # Check if in range: current < version <= latest
-                    if current < rel_ver <= latest:
-                        if body:
-                            header = f"## Release {tag_name}\n"
-                            relevant_notes.append(header + body)
-                except Exception:
-                    # Skip tags that don't look like versions
+                # Skip tags that don't look like versions (e.g. "nightly-2024-01-01")
+                if not _VER_RE.match(version_str):
+                    continue
+                rel_ver = _parse_ver(version_str)
+                if rel_ver is None:
                     continue
+                # Check if in range: current < version <= latest
+                if current < rel_ver <= latest:
+                    if body:
+                        header = f"## Release {tag_name}\n"
+                        relevant_notes.append(header + body)
             
             if relevant_notes:
                 # Releases often returned newest first, but we might want them in order?
@@ -108,10 +313,33 @@ class GitHubRetriever(BaseRetriever):
                 return "\n\n".join(relevant_notes)
                 
         except Exception as e:
-            logger.debug(f"Error fetching release range: {e}")
+            logger.debug(f"Error aggregating release range: {e}")
             
         return None
 
+    def _list_releases(self, repo_slug: str) -> Optional[List[Dict[str, Any]]]:
+        """Fetches the latest 100 releases once per repo and memoizes the list."""
+        if repo_slug in self._releases_cache:
+            return self._releases_cache[repo_slug]
+
+        url = f"https://api.github.com/repos/{repo_slug}/releases?per_page=100"
+        logger.debug(f"Fetching release history from {url}")
+        
+        releases = None
+        try:
+            resp = self._get(url, timeout=10)
+            if resp.status_code == 200:
+                data = orjson.loads(resp.content)
+                if isinstance(data, list):
+                    releases = data
+            else:
+                logger.debug(f"Failed to list releases: {resp.status_code}")
+        except Exception as e:
+            logger.debug(f"Error fetching release list: {e}")
+
+        self._releases_cache[repo_slug] = releases
+        return releases
+
     def _get_release_note(self, repo_slug: str, version: str, package_name: Optional[str] = None) -> Optional[str]:
         # Legacy method for single release, or fallback if range fails?
         # Actually, let's just use the range logic inside get_changelog() 
@@ -125,63 +353,159 @@ class GitHubRetriever(BaseRetriever):
             tags_to_try.append(f"{package_name}-{version}")   # common style
             tags_to_try.append(f"{package_name}-v{version}")  # common style
 
+        # Match against the memoized release list first; it is usually already fetched
+        releases_by_tag = {r.get("tag_name"): r for r in self._list_releases(repo_slug) or []}
         for tag in tags_to_try:
-            url = f"https://api.github.com/repos/{repo_slug}/releases/tags/{tag}"
-            logger.debug(f"Checking GitHub releases for tag: {tag}")
-            try:
-                resp = requests.get(url, headers=self._get_headers(), timeout=5)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    return data.get("body")
-            except requests.RequestException:
-                pass
+            if tag in releases_by_tag:
+                logger.debug(f"Found release {tag} in cached release list")
+                return releases_by_tag[tag].get("body")
+
+        # Fall back to per-tag lookups for tags outside the latest 100 releases
+        logger.debug(f"Checking GitHub releases for tags: {tags_to_try}")
+        urls = [f"https://api.github.com/repos/{repo_slug}/releases/tags/{tag}" for tag in tags_to_try]
+        resp = self._probe(urls)
+        if resp is not None:
+            return orjson.loads(resp.content).get("body")
         return None
 
-    def _get_changelog_file(self, repo_slug: str, subdirectory: Optional[str] = None, specific_filename: Optional[str] = None) -> Optional[str]:
-        files = [specific_filename] if specific_filename else ["CHANGELOG.md", "History.md", "RELEASES.md", "CHANGES.md"]
+    def _get_changelog_file(self, repo_slug: str, subdirectory: Optional[str] = None, specific_filename: Optional[str] = None, target_version: Optional[str] = None) -> Optional[str]:
+        files = [specific_filename] if specific_filename else CHANGELOG_FILENAMES
         
-        for filename in files:
-            path = f"{subdirectory}/{filename}" if subdirectory else filename
-            url = f"https://api.github.com/repos/{repo_slug}/contents/{path}"
-            logger.debug(f"Checking for file: {path}")
-            try:
-                resp = requests.get(url, headers=self._get_headers(), timeout=5)
-                if resp.status_code == 200:
-                    content = resp.json().get("content", "")
-                    if content:
-                        logger.debug(f"Successfully retrieved {filename}")
-                        return base64.b64decode(content).decode("utf-8", errors="ignore")
-                else:
-                     logger.debug(f"File lookup for {path} returned {resp.status_code}")
-            except requests.RequestException as e:
-                logger.debug(f"GitHub file request failed: {e}")
+        paths = [f"{subdirectory}/{filename}" if subdirectory else filename for filename in files]
+        prefetched_missing = False
+        if all((repo_slug, path) in self._blob_cache for path in paths):
+            logger.debug(f"Using prefetched files: {paths}")
+            text = next((self._blob_cache[(repo_slug, path)] for path in paths if self._blob_cache[(repo_slug, path)]), None)
+            if text or specific_filename:
+                return text
+            # The prefetch only covers the Markdown names; CHANGES.rst, NEWS.md etc. need the tree
+            prefetched_missing = True
+
+        if not specific_filename:
+            # One tree listing tells us which changelog file exists, instead of probing each name
+            listed = self._list_changelog_files(repo_slug, subdirectory)
+            if listed is not None:
+                if not listed:
+                    logger.debug(f"No changelog file in {repo_slug} tree")
+                    return None
+                paths = [f"{subdirectory}/{listed[0]}" if subdirectory else listed[0]]
+            elif prefetched_missing:
+                return None
+
+        logger.debug(f"Checking for files: {paths}")
+        raw_results = self._map(lambda path: self._fetch_raw(repo_slug, path, target_version), paths)
+        for path, (text, _) in zip(paths, raw_results):
+            if text:
+                logger.debug(f"Successfully retrieved {path}")
+                return text
+        if all(definitive for _, definitive in raw_results):
+            return None
+
+        # Raw host was unreachable or refused; retry through the contents API
+        urls = [f"https://api.github.com/repos/{repo_slug}/contents/{path}" for path in paths]
+        resp = self._probe(urls)
+        if resp is not None:
+            content = orjson.loads(resp.content).get("content", "")
+            if content:
+                logger.debug(f"Successfully retrieved {resp.url}")
+                return base64.b64decode(content).decode("utf-8", errors="ignore")
                 
         return None
 
-    def _scan_readme_for_changelog(self, repo_slug: str, subdirectory: Optional[str] = None) -> Optional[str]:
-        # Fetch README
+    def _get_default_branch(self, repo_slug: str) -> Optional[str]:
+        if repo_slug not in self._default_branch_cache:
+            branch = None
+            try:
+                resp = self._get(f"https://api.github.com/repos/{repo_slug}", timeout=5)
+                if resp.status_code == 200:
+                    branch = orjson.loads(resp.content).get("default_branch")
+            except Exception as e:
+                logger.debug(f"Failed to resolve default branch for {repo_slug}: {e}")
+            self._default_branch_cache[repo_slug] = branch if isinstance(branch, str) else None
+        return self._default_branch_cache[repo_slug]
+
+    def _list_changelog_files(self, repo_slug: str, subdirectory: Optional[str] = None) -> Optional[List[str]]:
+        """
+        Lists changelog-like files in the repo root (or subdirectory) via the git trees API.
+        Returns matching filenames in priority order, or None if the tree could not be read.
+        """
+        branch = self._get_default_branch(repo_slug)
+        if not branch:
+            return None
+        tree_ref = f"{branch}:{subdirectory}" if subdirectory else branch
+        try:
+            resp = self._get(f"https://api.github.com/repos/{repo_slug}/git/trees/{tree_ref}", timeout=5)
+            if resp.status_code != 200:
+                logger.debug(f"Tree lookup for {tree_ref} returned {resp.status_code}")
+                return None
+            entries = orjson.loads(resp.content).get("tree", [])
+        except Exception as e:
+            logger.debug(f"Tree lookup failed for {repo_slug}: {e}")
+            return None
+
+        blobs = {entry.get("path", "").lower(): entry.get("path") for entry in entries if entry.get("type") == "blob"}
+        return [blobs[name] for name in CHANGELOG_TREE_CANDIDATES if name in blobs]
+
+    def _fetch_raw(self, repo_slug: str, path: str, target_version: Optional[str] = None, range_bytes: int = RAW_RANGE_BYTES) -> Tuple[Optional[str], bool]:
+        """
+        Fetches a file from raw.githubusercontent.com, reading only the first range_bytes.
+        The full file is fetched only when target_version is not in the partial content.
+        Returns (text, definitive); definitive is False when the contents API should be tried instead.
+        """
+        url = f"https://raw.githubusercontent.com/{repo_slug}/HEAD/{path}"
+        token = self._tokens.pick()
+        auth = {"Authorization": f"Bearer {token}"} if token else {}
+        try:
+            resp = self._session.get(url, headers={**auth, "Range": f"bytes=0-{range_bytes - 1}"}, timeout=5)
+            if resp.status_code == 404:
+                return None, True
+            if resp.status_code not in (200, 206):
+                logger.debug(f"Raw lookup for {path} returned {resp.status_code}")
+                return None, False
+            text = resp.content.decode("utf-8", errors="ignore")
+            if resp.status_code == 206 and target_version and target_version not in text:
+                logger.debug(f"{target_version} not in first {range_bytes} bytes of {path}, fetching full file")
+                full = self._session.get(url, headers=auth, timeout=10)
+                if full.status_code == 200:
+                    text = full.content.decode("utf-8", errors="ignore")
+            return text, True
+        except requests.RequestException as e:
+            logger.debug(f"Raw request failed for {path}: {e}")
+            return None, False
+
+    def _fetch_readme(self, repo_slug: str, subdirectory: Optional[str] = None) -> Optional[str]:
+        readme_path = f"{subdirectory}/README.md" if subdirectory else "README.md"
+        prefetched = self._blob_cache.get((repo_slug, readme_path))
+        if prefetched:
+            return prefetched
+
+        # Only the head of the README is scanned; the raw host also skips the base64 payload
+        text, _ = self._fetch_raw(repo_slug, readme_path, range_bytes=README_RANGE_BYTES)
+        if text:
+            return text
+
         url = f"https://api.github.com/repos/{repo_slug}/readme"
         if subdirectory:
             # If in subdirectory, explicitly look for README in that dir
             url = f"https://api.github.com/repos/{repo_slug}/contents/{subdirectory}/README.md"
         
         logger.debug(f"Fetching README from {url}")
+        resp = self._get(url, timeout=5)
+        if resp.status_code != 200:
+            logger.debug(f"README fetch failed: {resp.status_code}")
+            return None
+        content_b64 = orjson.loads(resp.content).get("content", "")
+        if not content_b64:
+            return None
+        return base64.b64decode(content_b64).decode("utf-8", errors="ignore")
+
+    def _scan_readme_for_changelog(self, repo_slug: str, subdirectory: Optional[str] = None) -> Optional[str]:
         try:
-            resp = requests.get(url, headers=self._get_headers(), timeout=5)
-            if resp.status_code == 200:
-                content_b64 = resp.json().get("content", "")
-                if not content_b64:
-                    return None
-                readme_text = base64.b64decode(content_b64).decode("utf-8", errors="ignore")
-                
-                # Simple link extraction: [Link Text](Link URL)
-                import re
-                # Look for links with text containing 'change', 'history', 'release'
-                # Case insensitive
-                link_pattern = re.compile(r'\[([^\]]*?(?:change|history|release)[^\]]*?)\]\(([^\)]+)\)', re.IGNORECASE)
-                matches = link_pattern.findall(readme_text)
-                
-                for text, link_url in matches:
+            readme_text = self._fetch_readme(repo_slug, subdirectory)
+            if readme_text:
+                # Scan lazily; we stop at the first relative link
+                for match in _CHANGELOG_LINK_RE.finditer(readme_text):
+                    text, link_url = match.groups()
                     logger.debug(f"Found potential changelog link in README: [{text}]({link_url})")
                     
                     # If it's a relative link, try to fetch it
@@ -194,8 +518,6 @@ class GitHubRetriever(BaseRetriever):
                         
                         logger.debug(f"Following relative link: {clean_link}")
                         return self._get_changelog_file(repo_slug, subdirectory, specific_filename=clean_link)
-            else:
-                logger.debug(f"README fetch failed: {resp.status_code}")
         except Exception as e:
             logger.debug(f"Error scanning README: {e}")
             
@@ -1,7 +1,14 @@
-from typing import Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
 from anvil.retrievers.base import BaseRetriever
 from anvil.retrievers.pypi import PyPIRetriever
 from anvil.retrievers.github import GitHubRetriever
+from anvil.retrievers.session import POOL_SIZE
+from anvil.core.logging import get_logger
+
+logger = get_logger("retriever.main")
 
 class ChangelogRetriever(BaseRetriever):
     """Facade for retrieving changelogs using multiple strategies."""
@@ -19,26 +26,72 @@ class ChangelogRetriever(BaseRetriever):
         if not source_url:
             return None
             
-        # 2. Extract owner/repo from source URL
-        # Assumption: source_url is like https://github.com/owner/repo
-        if "github.com" in source_url:
-            # Format: https://github.com/owner/repo/tree/branch/subdir...
-            parts = source_url.split("github.com/")
-            if len(parts) > 1:
-                path_parts = parts[1].split('/')
-                if len(path_parts) >= 2:
-                    repo_slug = f"{path_parts[0]}/{path_parts[1]}"
-                    
-                    subdirectory = None
-                    # Check for '/tree/{branch}/...' pattern to extract subdir
-                    if len(path_parts) > 4 and path_parts[2] == "tree":
-                        # path_parts[3] is branch name (e.g. master)
-                        # path_parts[4:] is the subdirectory
-                        subdirectory = "/".join(path_parts[4:])
-                    elif len(path_parts) > 2 and path_parts[2] != "tree":
-                         # Sometimes it might just be /owner/repo/subdir directly (less common for browse URLs but possible)
-                         subdirectory = "/".join(path_parts[2:])
-                         
-                    return self.github.get_changelog(repo_slug, current_version, target_version, subdirectory, package_name=package_name)
-                
-        return None
+        # 2. Extract owner/repo (and optional subdirectory) from source URL
+        # Format: https://github.com/owner/repo/tree/branch/subdir...
+        if "://" not in source_url:
+            # Some packages list a bare "github.com/owner/repo"; urlsplit would see no host
+            source_url = f"https://{source_url}"
+        url = urlsplit(source_url)
+        if url.netloc != "github.com" and not url.netloc.endswith(".github.com"):
+            return None
+
+        # At most 5 parts: owner, repo, 'tree', branch, rest-of-path
+        path_parts = url.path.strip("/").split("/", 4)
+        if len(path_parts) < 2:
+            return None
+        repo_slug = f"{path_parts[0]}/{path_parts[1]}"
+
+        subdirectory = None
+        if len(path_parts) > 4 and path_parts[2] == "tree":
+            # path_parts[3] is branch name (e.g. master), path_parts[4] is the subdirectory
+            subdirectory = path_parts[4]
+        elif len(path_parts) > 2 and path_parts[2] != "tree":
+            # Sometimes it might just be /owner/repo/subdir directly (less common for browse URLs but possible)
+            subdirectory = "/".join(path_parts[2:])
+
+        return self.github.get_changelog(repo_slug, current_version, target_version, subdirectory, package_name=package_name)
+
+    def get_changelogs(self, packages: Iterable[Tuple[str, str, str]], max_workers: int = POOL_SIZE) -> Dict[str, Optional[str]]:
+        """
+        Fetches changelogs for many (package_name, current_version, target_version) tuples on a thread pool.
+        Lookups are I/O-bound, so threads give near-linear speedup. Returns {package_name: changelog}.
+        """
+        packages = list(packages)
+        changelogs: Dict[str, Optional[str]] = {}
+        if not packages:
+            return changelogs
+
+        # Worker count never exceeds the shared session's connection pool, and each worker
+        # probes its candidates sequentially so the total stays within it
+        with ThreadPoolExecutor(max_workers=min(max_workers, POOL_SIZE, len(packages))) as pool:
+            futures = {pool.submit(self._get_changelog_sequential, p, c, t): p for p, c, t in packages}
+            for future in as_completed(futures):
+                package_name = futures[future]
+                try:
+                    changelogs[package_name] = future.result()
+                except Exception as e:
+                    logger.debug(f"Changelog fetch failed for {package_name}: {e}")
+                    changelogs[package_name] = None
+        return changelogs
+
+    def _get_changelog_sequential(self, package_name: str, current_version: str, target_version: str) -> Optional[str]:
+        with self.github.sequential_probes():
+            return self.get_changelog(package_name, current_version, target_version)
+
+    async def aget_changelog_many(self, packages: Iterable[Tuple[str, str, str]]) -> List[Optional[str]]:
+        """
+        Fetches changelogs for many (package_name, current_version, target_version) tuples concurrently.
+        Results are returned in the same order as the input; failed lookups yield None.
+        """
+        packages = list(packages)
+        results = await asyncio.gather(
+            *(self.aget_changelog(p, c, t) for p, c, t in packages),
+            return_exceptions=True
+        )
+        changelogs = []
+        for (package_name, _, _), result in zip(packages, results):
+            if isinstance(result, Exception):
+                logger.debug(f"Changelog fetch failed for {package_name}: {result}")
+                result = None
+            changelogs.append(result)
+        return changelogs
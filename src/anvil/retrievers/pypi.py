@@ -1,10 +1,84 @@
+import functools
+import orjson
 import requests
 from typing import Optional, Dict, Any
 from anvil.retrievers.base import BaseRetriever
+from anvil.retrievers.cache import HttpCache
+from anvil.retrievers.session import get_session
 from anvil.core.logging import get_logger
 
 logger = get_logger("retriever.pypi")
 
+# Source-URL keys checked in project_urls, in priority order
+SOURCE_URL_KEYS = [
+    "source", "source code", "repository", "code",
+    "home", "homepage",
+    "issue tracker", "tracker", "bug tracker"
+]
+
+class _PyPIUnavailable(Exception):
+    """A non-200, non-404 answer from PyPI (e.g. 429/503); raised so lru_cache does not keep it."""
+
+
+@functools.lru_cache(maxsize=512)
+def _pypi_body(package_name: str) -> Optional[bytes]:
+    """
+    Fetches a package's raw PyPI JSON once per process.
+    Only successful lookups (and 404s) are memoized; request errors and other statuses
+    raise, so the next call retries. The body is kept as bytes so that every caller
+    parses its own dict instead of sharing one mutable object.
+    """
+    url = f"https://pypi.org/pypi/{package_name}/json"
+    logger.debug(f"Fetching: {url}")
+    resp = HttpCache().get(get_session(), url, timeout=5)
+    if resp.status_code == 200:
+        return resp.content
+    if resp.status_code == 404:
+        logger.debug(f"{package_name} not found on PyPI")
+        return None
+    raise _PyPIUnavailable(f"PyPI returned status code: {resp.status_code}")
+
+def _parse_pypi_json(package_name: str, body: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    if body is None:
+        return None
+    try:
+        # orjson parses the raw bytes directly, skipping the str decode
+        return orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        logger.debug(f"Invalid JSON from PyPI for {package_name}: {e}")
+        return None
+
+@functools.lru_cache(maxsize=512)
+def _source_url(package_name: str) -> Optional[str]:
+    """Memoized like _pypi_body: fetch failures propagate instead of being cached as None."""
+    data = _parse_pypi_json(package_name, _pypi_body(package_name))
+    if not data:
+        logger.debug(f"No JSON data found for {package_name} on PyPI")
+        return None
+
+    info = data.get("info", {})
+    project_urls = info.get("project_urls") or {}
+
+    # Normalize keys to lowercase for case-insensitive matching
+    urls_lower = {k.lower(): v for k, v in project_urls.items()}
+
+    for key in SOURCE_URL_KEYS:
+        url = urls_lower.get(key)
+        if url and "github.com" in url:
+            cleaned_url = PyPIRetriever._clean_github_url(url)
+            logger.debug(f"Matched source URL '{cleaned_url}' via key '{key}'")
+            return cleaned_url
+
+    # Check 'home_page' field if not in project_urls
+    home_page = info.get("home_page")
+    if home_page and "github.com" in home_page:
+        cleaned_url = PyPIRetriever._clean_github_url(home_page)
+        logger.debug(f"Matched source URL '{cleaned_url}' via home_page field")
+        return cleaned_url
+
+    logger.debug(f"No GitHub source URL found in metadata for {package_name}")
+    return None
+
 class PyPIRetriever(BaseRetriever):
     """Fetches metadata from PyPI."""
     
@@ -24,54 +98,21 @@ class PyPIRetriever(BaseRetriever):
 
     def get_source_url(self, package_name: str) -> Optional[str]:
         logger.debug(f"Searching PyPI for source URL of: {package_name}")
-        data = self._fetch_pypi_json(package_name)
-        if not data:
-            logger.debug(f"No JSON data found for {package_name} on PyPI")
-            return None
-            
-        info = data.get("info", {})
-        project_urls = info.get("project_urls") or {}
-        
-        # Normalize keys to lowercase for case-insensitive matching
-        urls_lower = {k.lower(): v for k, v in project_urls.items()}
-        
-        candidates = [
-            "source", "source code", "repository", "code", 
-            "home", "homepage", 
-            "issue tracker", "tracker", "bug tracker"
-        ]
-        
-        for key in candidates:
-            url = urls_lower.get(key)
-            if url and "github.com" in url:
-                cleaned_url = self._clean_github_url(url)
-                logger.debug(f"Matched source URL '{cleaned_url}' via key '{key}'")
-                return cleaned_url
-                
-        # Check 'home_page' field if not in project_urls
-        home_page = info.get("home_page")
-        if home_page and "github.com" in home_page:
-            cleaned_url = self._clean_github_url(home_page)
-            logger.debug(f"Matched source URL '{cleaned_url}' via home_page field")
-            return cleaned_url
-            
-        logger.debug(f"No GitHub source URL found in metadata for {package_name}")
+        try:
+            return _source_url(package_name)
+        except (requests.RequestException, _PyPIUnavailable) as e:
+            logger.debug(f"PyPI request failed: {e}")
         return None
 
     def _fetch_pypi_json(self, package_name: str) -> Optional[Dict[str, Any]]:
-        # TODO: Implement caching to avoid re-fetching for same package
-        url = f"https://pypi.org/pypi/{package_name}/json"
-        logger.debug(f"Fetching: {url}")
         try:
-            resp = requests.get(url, timeout=5)
-            if resp.status_code == 200:
-                return resp.json()
-            logger.debug(f"PyPI returned status code: {resp.status_code}")
-        except requests.RequestException as e:
+            return _parse_pypi_json(package_name, _pypi_body(package_name))
+        except (requests.RequestException, _PyPIUnavailable) as e:
             logger.debug(f"PyPI request failed: {e}")
         return None
         
-    def _clean_github_url(self, url: str) -> str:
+    @staticmethod
+    def _clean_github_url(url: str) -> str:
         # Normalize: https://github.com/user/repo -> https://github.com/user/repo
         # Remove .git, trailing slashes
         url = url.rstrip("/")
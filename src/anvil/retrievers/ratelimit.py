@@ -0,0 +1,183 @@
+import threading
+import time
+import requests
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from anvil.core.logging import get_logger
+
+logger = get_logger("retriever.ratelimit")
+
+
+def _int_header(resp: requests.Response, name: str) -> Optional[int]:
+    value = resp.headers.get(name)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def is_rate_limited(resp: requests.Response) -> bool:
+    """True for 403/429 responses caused by a primary or secondary rate limit."""
+    if resp.status_code not in (403, 429):
+        return False
+    return resp.status_code == 429 or _int_header(resp, "Retry-After") is not None or _int_header(resp, "X-RateLimit-Remaining") == 0
+
+
+class TokenPool:
+    """
+    Round-robins requests across several GitHub tokens.
+    Each token has its own hourly budget, so capacity grows with the pool size.
+    Tokens are picked by highest X-RateLimit-Remaining, then earliest reset.
+    """
+
+    def __init__(self, tokens: List[str]):
+        # (token, remaining, reset_at); remaining is None until GitHub reports it
+        self._tokens: deque = deque((token, None, None) for token in dict.fromkeys(tokens))
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def pick(self) -> Optional[str]:
+        """Returns the token with the most budget left and moves it to the back of the queue."""
+        with self._lock:
+            if not self._tokens:
+                return None
+            now = time.time()
+            best = max(self._tokens, key=lambda entry: self._score(entry, now))
+            self._tokens.remove(best)
+            self._tokens.append(best)
+            return best[0]
+
+    def update(self, token: Optional[str], resp: requests.Response) -> bool:
+        """
+        Records a token's budget from a response's rate-limit headers.
+        Returns True when the response was rate limited and another token could take the retry.
+        """
+        if token is None:
+            return False
+        remaining = _int_header(resp, "X-RateLimit-Remaining")
+        reset_at = _int_header(resp, "X-RateLimit-Reset")
+        limited = is_rate_limited(resp)
+        if limited:
+            retry_after = _int_header(resp, "Retry-After")
+            remaining = 0
+            if retry_after is not None:
+                reset_at = int(time.time()) + retry_after
+        if remaining is None:
+            return False
+        with self._lock:
+            for i, (name, _, _) in enumerate(self._tokens):
+                if name == token:
+                    self._tokens[i] = (name, remaining, float(reset_at) if reset_at is not None else None)
+                    break
+            if not limited:
+                return False
+            now = time.time()
+            return any(entry[0] != token and self._score(entry, now)[0] > 0 for entry in self._tokens)
+
+    @staticmethod
+    def _score(entry: Tuple[str, Optional[int], Optional[float]], now: float) -> Tuple[float, float]:
+        _, remaining, reset_at = entry
+        if remaining is None or (reset_at is not None and reset_at <= now):
+            # Unknown or already reset: assume a full budget
+            return float("inf"), 0.0
+        return float(remaining), -(reset_at or 0.0)
+
+
+class GitHubRateLimiter:
+    """
+    Throttles GitHub API traffic using the rate-limit headers GitHub returns.
+    Caps in-flight requests, pauses when a token's X-RateLimit-Remaining hits zero, and
+    retries 403/429 rate-limit responses after Retry-After (or exponential backoff).
+    Budgets are tracked per token (None = unauthenticated), since each has its own hourly limit.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_retries: int = 3, backoff_base: float = 1.0, max_wait: float = 60.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        # Longer waits (e.g. an exhausted hourly budget) fail fast instead of stalling the CLI
+        self.max_wait = max_wait
+        # token -> (remaining, reset_at)
+        self._budgets: Dict[Optional[str], Tuple[int, Optional[float]]] = {}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    def request(self, send: Callable[[], requests.Response], token: Optional[str] = None, rotate: Optional[Callable[[requests.Response], bool]] = None) -> requests.Response:
+        """
+        Sends a request through the limiter, retrying on rate-limit responses.
+        :param token: The token send() authenticates with; only its budget is waited on.
+        :param rotate: Called with each response; returning True hands a rate-limited response
+                       back to the caller (to re-send with another token) instead of waiting here.
+        """
+        attempt = 0
+        while True:
+            self._wait_for_budget(token)
+            with self._slots:
+                resp = send()
+            self.update(resp, token)
+            if rotate is not None and rotate(resp):
+                return resp
+
+            delay = self._retry_delay(resp, attempt)
+            if delay is None or attempt >= self.max_retries:
+                return resp
+            if delay > self.max_wait:
+                logger.warning(f"GitHub rate limit exceeded; retry would need {delay:.0f}s, giving up")
+                return resp
+            logger.debug(f"GitHub rate limited ({resp.status_code}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def update(self, resp: requests.Response, token: Optional[str] = None) -> None:
+        """Records the remaining budget a response reports for the token it was sent with."""
+        remaining = _int_header(resp, "X-RateLimit-Remaining")
+        reset_at = _int_header(resp, "X-RateLimit-Reset")
+        if remaining is None:
+            return
+        with self._lock:
+            self._budgets[token] = (remaining, float(reset_at) if reset_at is not None else None)
+
+    def remaining(self, token: Optional[str] = None) -> Optional[int]:
+        """Last reported budget for a token, or None if GitHub has not reported one yet."""
+        with self._lock:
+            budget = self._budgets.get(token)
+        return budget[0] if budget else None
+
+    def _wait_for_budget(self, token: Optional[str]) -> None:
+        with self._lock:
+            remaining, reset_at = self._budgets.get(token, (None, None))
+            if remaining != 0 or reset_at is None:
+                return
+            delay = reset_at - time.time()
+        if 0 < delay <= self.max_wait:
+            logger.debug(f"GitHub rate limit budget exhausted, waiting {delay:.1f}s for reset")
+            time.sleep(delay)
+
+    def _retry_delay(self, resp: requests.Response, attempt: int) -> Optional[float]:
+        if not is_rate_limited(resp):
+            return None
+        retry_after = _int_header(resp, "Retry-After")
+        if retry_after is not None:
+            return float(retry_after)
+        if _int_header(resp, "X-RateLimit-Remaining") == 0:
+            reset_at = _int_header(resp, "X-RateLimit-Reset")
+            if reset_at is not None:
+                return max(reset_at - time.time(), 0.0)
+        if resp.status_code == 429:
+            return self.backoff_base * (2 ** attempt)
+        # Plain 403s (permissions, missing token scopes) are not retried
+        return None
+
+
+_limiter: Optional[GitHubRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> GitHubRateLimiter:
+    """Returns the process-wide GitHub rate limiter (the budget is shared per token/IP)."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = GitHubRateLimiter()
+    return _limiter
@@ -0,0 +1,98 @@
+import threading
+import requests
+from typing import Any, Optional
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from anvil.core.logging import get_logger
+
+logger = get_logger("retriever.session")
+
+# Upper bound on concurrent connections kept alive per host.
+POOL_SIZE = 16
+
+
+class HTTP2Adapter(BaseAdapter):
+    """
+    Transport adapter that sends requests over HTTP/2 using httpx.
+    Concurrent requests to the same host are multiplexed over one TLS connection.
+    Requires the optional 'httpx[http2]' extra; see get_session().
+    """
+
+    def __init__(self, client: Optional[Any] = None):
+        super().__init__()
+        import httpx
+        self._httpx = httpx
+        self._client = client or httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=POOL_SIZE, max_connections=POOL_SIZE * 2)
+        )
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, timeout: Any = None, verify: Any = True, cert: Any = None, proxies: Any = None) -> requests.Response:
+        httpx = self._httpx
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        try:
+            resp = self._client.request(
+                request.method,
+                request.url,
+                headers=dict(request.headers),
+                content=request.body,
+                timeout=timeout
+            )
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e, request=request)
+        except httpx.HTTPError as e:
+            raise requests.ConnectionError(e, request=request)
+
+        response = requests.Response()
+        response.status_code = resp.status_code
+        response.reason = resp.reason_phrase
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        # httpx has already read and decoded the body
+        response._content = resp.content
+        response._content_consumed = True
+        response.encoding = resp.encoding
+        return response
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def _http2_available() -> bool:
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide HTTP session shared by all retrievers.
+    Reusing one pooled session keeps TCP/TLS connections to PyPI and GitHub alive
+    across packages instead of re-handshaking on every request. When the optional
+    'httpx[http2]' extra is installed, HTTPS traffic is sent over HTTP/2.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                if _http2_available():
+                    session.mount("https://", HTTP2Adapter())
+                    logger.debug("Using HTTP/2 transport for HTTPS requests")
+                logger.debug(f"Created shared HTTP session (pool size: {POOL_SIZE})")
+                _session = session
+    return _session
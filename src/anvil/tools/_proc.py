@@ -0,0 +1,23 @@
+"""
+Process helpers shared by PackageManager and TestRunner
+"""
+import functools
+import os
+import shutil
+from typing import Dict, Optional
+
+
+@functools.lru_cache(maxsize=None)
+def which(name: str) -> Optional[str]:
+    """shutil.which, memoized so repeated PackageManager/TestRunner setup skips the PATH scan."""
+    return shutil.which(name)
+
+
+def invalidate_which_cache() -> None:
+    """Forgets cached executable lookups (e.g. after PATH or the active venv changes)."""
+    which.cache_clear()
+
+
+def trimmed_env(*drop: str) -> Dict[str, str]:
+    """A copy of os.environ without the given variables, for passing to child processes."""
+    return {key: value for key, value in os.environ.items() if key not in drop}
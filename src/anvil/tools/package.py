@@ -1,65 +1,320 @@
+import asyncio
+import functools
+import logging
+import shlex
 import subprocess
 import shutil
 import os
-from typing import List, Optional
+import tempfile
+import tomli
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from importlib import metadata
+from packaging.version import InvalidVersion, Version
 from pathlib import Path
+from anvil.core.env import EnvironmentChecker
 from anvil.core.logging import get_logger
+from anvil.tools._proc import trimmed_env, which
+from anvil.tools.runner import TestRunner
 
 logger = get_logger("tools.package")
 
+def _same_version(a: str, b: str) -> bool:
+    try:
+        return Version(a) == Version(b)
+    except InvalidVersion:
+        return a == b
+
+def _installer_cache_env(env: Dict[str, str]) -> Dict[str, str]:
+    """
+    With ANVIL_CACHE_DIR set, the pip/uv wheel caches live under it as well, so a CI job can
+    persist one directory and keep installs warm. Explicit UV_CACHE_DIR / PIP_CACHE_DIR win.
+    Otherwise pip and uv keep using their own per-user caches, which already persist across runs.
+    """
+    override = env.get("ANVIL_CACHE_DIR")
+    if not override:
+        return {}
+    root = Path(override).expanduser()
+    cache_env = {}
+    for var, name in (("UV_CACHE_DIR", "uv"), ("PIP_CACHE_DIR", "pip")):
+        if var not in env:
+            cache_env[var] = str(root / name)
+    return cache_env
+
+@functools.lru_cache(maxsize=32)
+def _detect_project_kind(root_str: str, pyproject_mtime: Optional[float], has_uv_lock: bool, has_poetry_lock: bool) -> Tuple[bool, bool]:
+    """
+    Returns (is_uv_project, is_poetry_project).
+    pyproject.toml's mtime is part of the cache key, so an edited manifest is re-read.
+    """
+    is_poetry_project = has_poetry_lock
+    # Check for poetry configuration
+    if not is_poetry_project and pyproject_mtime is not None:
+        try:
+            with open(Path(root_str) / "pyproject.toml", "rb") as f:
+                data = tomli.load(f)
+            is_poetry_project = "poetry" in data.get("tool", {})
+        except (OSError, tomli.TOMLDecodeError) as e:
+            # OSError: deleted or unreadable since PackageManager stat()ed it
+            logger.debug(f"Could not parse pyproject.toml: {e}")
+    return has_uv_lock, is_poetry_project
+
 class PackageManager:
     """Abstracts package management operations (pip/uv)."""
     
-    def __init__(self, project_root: Path):
+    def __init__(self, project_root: Path, timeout: int = 120):
+        """
+        :param timeout: Seconds a trial run (env-only install/uninstall, 'pip check') may take
+                        before it is killed and treated as failed (e.g. a stalled download).
+                        Manifest updates ('uv add', 'poetry add') are never cut off: locking a
+                        large project can take longer, and killing it mid-write would leave
+                        pyproject.toml and the lock file out of sync.
+        """
         self.project_root = project_root
-        self.has_uv = shutil.which("uv") is not None
-        self.has_poetry = shutil.which("poetry") is not None
-        self.is_uv_project = (project_root / "uv.lock").exists()
-        # Check for poetry configuration
-        self.is_poetry_project = (project_root / "poetry.lock").exists()
-        if not self.is_poetry_project and (project_root / "pyproject.toml").exists():
-            with open(project_root / "pyproject.toml", "r") as f:
-                content = f.read()
-                if "[tool.poetry]" in content:
-                    self.is_poetry_project = True
-
-    def install(self, package: str, version: Optional[str] = None, update_manifest: bool = False) -> bool:
+        self.timeout = timeout
+        self.has_uv = which("uv") is not None
+        self.has_poetry = which("poetry") is not None
+        # Built once and passed to every installer run. LS_COLORS only bloats the child's
+        # environment; Anvil's own PYTHONPATH must not leak into the project's pip/uv.
+        self._child_env = trimmed_env("LS_COLORS", "PYTHONPATH")
+        self._child_env.update(_installer_cache_env(self._child_env))
+        try:
+            pyproject_mtime: Optional[float] = (project_root / "pyproject.toml").stat().st_mtime
+        except OSError:
+            pyproject_mtime = None
+        self.is_uv_project, self.is_poetry_project = _detect_project_kind(
+            str(project_root),
+            pyproject_mtime,
+            (project_root / "uv.lock").exists(),
+            (project_root / "poetry.lock").exists()
+        )
+
+    def install(self, package: str, version: Optional[str] = None, update_manifest: bool = False, no_deps: bool = False) -> bool:
         """
         Installs a specific version of a package.
         :param update_manifest: If True, writes changes to manifest (e.g. 'uv add' or 'poetry add').
                                 If False, only installs into environment (e.g. 'uv pip install').
+        :param no_deps: Trial fast path, see install_many.
         """
-        specifier = f"{package}=={version}" if version else package
+        return self.install_many([(package, version)], update_manifest=update_manifest, no_deps=no_deps)
+
+    def install_many(self, packages: List[Tuple[str, Optional[str]]], update_manifest: bool = False, no_deps: bool = False) -> bool:
+        """
+        Installs several packages with a single pip/uv invocation so the resolver runs once.
+        :param packages: (name, version) pairs; a None version installs the latest release.
+        :param no_deps: Install with '--no-deps' to skip dependency resolution, then validate the
+                        environment with 'pip check'. Much faster for a single version bump, but a
+                        release that needs newer dependencies would be left broken, so a conflict
+                        the check did not already report before the install falls back to a
+                        normal install. Ignored when update_manifest is True.
+        """
+        specifiers = self._specifiers_to_install(packages, update_manifest)
+        if not specifiers:
+            return True
+        trial = no_deps and not update_manifest
+        cmd = self._get_install_command_many(specifiers, update_manifest=update_manifest, no_deps=trial)
+        timeout = self._timeout_for(update_manifest)
+        if not trial:
+            return self._run(cmd, timeout=timeout)
+
+        # Conflicts the venv already had must not send every trial down the slow path
+        baseline = self._check_problems()
+        installed = self._run(cmd, timeout=timeout)
+        if self._trial_passed(installed, baseline, self._check_problems() if installed else None):
+            return True
+        return self._run(self._get_install_command_many(specifiers, update_manifest=update_manifest), timeout=timeout)
+
+    async def install_async(self, package: str, version: Optional[str] = None, update_manifest: bool = False, no_deps: bool = False) -> bool:
+        """
+        Async variant of install, with the same skipping of satisfied pins and the same
+        no_deps trial and fallback ('pip check' runs in a worker thread).
+        Runs the installer with asyncio's subprocess support, so managers for separate
+        environments (e.g. one trial venv per package) can install concurrently.
+        Concurrent installs into the *same* environment are not safe.
+        """
+        specifiers = self._specifiers_to_install([(package, version)], update_manifest)
+        if not specifiers:
+            return True
+        trial = no_deps and not update_manifest
+        cmd = self._get_install_command_many(specifiers, update_manifest=update_manifest, no_deps=trial)
+        timeout = self._timeout_for(update_manifest)
+        if not trial:
+            return await self._arun(cmd, timeout=timeout)
+
+        baseline = await asyncio.to_thread(self._check_problems)
+        installed = await self._arun(cmd, timeout=timeout)
+        after = await asyncio.to_thread(self._check_problems) if installed else None
+        if self._trial_passed(installed, baseline, after):
+            return True
+        return await self._arun(self._get_install_command_many(specifiers, update_manifest=update_manifest), timeout=timeout)
+
+    def _specifiers_to_install(self, packages: List[Tuple[str, Optional[str]]], update_manifest: bool) -> List[str]:
+        """Turns (name, version) pairs into installer specifiers, minus env-only pins already satisfied."""
+        if not update_manifest:
+            packages = self._unsatisfied(packages)
+        if not packages:
+            return []
+        specifiers = [f"{package}=={version}" if version else package for package, version in packages]
         mode = "PERSISTENT" if update_manifest else "TEMPORARY"
-        logger.info(f"Installing {specifier} (Mode: {mode})...")
-        
-        cmd = self._get_install_command(specifier, update_manifest)
-        return self._run(cmd)
+        logger.info(f"Installing {', '.join(specifiers)} (Mode: {mode})...")
+        return specifiers
+
+    @staticmethod
+    def _trial_passed(installed: bool, baseline: Optional[Set[str]], after: Optional[Set[str]]) -> bool:
+        """Judges a --no-deps trial install; logs why it needs a full install when it does not pass."""
+        if not installed:
+            logger.info("--no-deps install failed, retrying with full resolution...")
+        elif baseline is None or after is None:
+            logger.info("Dependency check could not run after --no-deps install, retrying with full resolution...")
+        elif after - baseline:
+            logger.debug(f"New dependency conflicts: {sorted(after - baseline)}")
+            logger.info("Dependency check failed after --no-deps install, retrying with full resolution...")
+        else:
+            return True
+        return False
+
+    def _unsatisfied(self, packages: List[Tuple[str, Optional[str]]]) -> List[Tuple[str, Optional[str]]]:
+        """
+        Drops pins the project's venv already has installed.
+        Unpinned entries always run, since they ask for the latest release.
+        """
+        site_packages = EnvironmentChecker(str(self.project_root)).site_packages
+        if not site_packages:
+            # No venv found: Anvil's own environment says nothing about the project's
+            return packages
+        pending = []
+        for package, version in packages:
+            # Look only at the venv: a sys.path lookup would also see Anvil's own packages
+            dist = next(iter(metadata.distributions(name=package, path=[str(site_packages)])), None) if version else None
+            if dist is not None and _same_version(dist.version, version):
+                logger.debug(f"{package}=={version} is already installed, skipping")
+            else:
+                pending.append((package, version))
+        return pending
 
-    # ... (uninstall) ...
+    def install_and_test(self, package: str, version: Optional[str] = None, test_args: Sequence[str] = ()) -> Tuple[bool, str]:
+        """
+        Tries a version and runs the project's tests against it; returns (success, output).
+        With uv this is a single 'uv run --with <specifier>' call: the trial version lives in an
+        ephemeral overlay, so the project's venv is unchanged and nothing needs rolling back.
+        Without uv the version is installed into the venv first (like install()), and the caller
+        still has to roll back a failed trial.
+        """
+        specifier = f"{package}=={version}" if version else package
+        runner = TestRunner(self.project_root)
+        if self.has_uv:
+            logger.info(f"Testing against {specifier} (uv overlay)...")
+            return runner.run_tests(extra_args=test_args, with_packages=[specifier])
+        if not self.install(package, version, no_deps=True):
+            return False, f"Failed to install {specifier}"
+        return runner.run_tests(extra_args=test_args)
 
-    def _get_install_command(self, specifier: str, update_manifest: bool) -> List[str]:
+    def session(self, update_manifest: bool = False, batch_size: int = 8) -> "InstallSession":
+        """
+        Returns a context manager that batches installs into as few pip/uv runs as possible:
+            with pm.session() as s:
+                for name, version in trials:
+                    s.install(name, version)
+        """
+        return InstallSession(self, update_manifest=update_manifest, batch_size=batch_size)
+
+    def uninstall(self, package: str, update_manifest: bool = False) -> bool:
+        """
+        Removes a package.
+        :param update_manifest: If True, also drops it from the manifest (e.g. 'uv remove').
+                                If False and the project has a (non-uv) venv, the files are
+                                deleted in-process without spawning pip.
+        """
+        logger.info(f"Uninstalling {package}...")
+        # uv projects keep going through uv so its view of the environment stays consistent
+        if not update_manifest and not self.is_uv_project:
+            site_packages = EnvironmentChecker(str(self.project_root)).site_packages
+            if site_packages and self._uninstall_in_process(package, site_packages):
+                return True
+        return self._run(self._get_uninstall_command(package, update_manifest=update_manifest), timeout=self._timeout_for(update_manifest))
+
+    def _uninstall_in_process(self, package: str, site_packages: Path) -> bool:
+        """
+        Deletes the files listed in the distribution's RECORD, like 'pip uninstall' does.
+        Returns False (caller falls back to pip) when the package or its RECORD is missing, or
+        when RECORD lists anything outside site-packages (console scripts, or a malformed
+        '../' entry); nothing is deleted in that case.
+        """
+        dist = next(iter(metadata.distributions(name=package, path=[str(site_packages)])), None)
+        if dist is None or dist.files is None:
+            return False
+        root = site_packages.resolve()
+        paths = [Path(dist.locate_file(file)).resolve() for file in dist.files]
+        outside = [path for path in paths if root not in path.parents]
+        if outside:
+            logger.debug(f"{package} has files outside {root} (e.g. {outside[0]}), leaving it to pip")
+            return False
+        try:
+            for path in paths:
+                path.unlink(missing_ok=True)
+            # Prune directories left empty, deepest first (stale __pycache__ included)
+            for directory in sorted({path.parent for path in paths}, key=lambda d: len(d.parts), reverse=True):
+                if directory == root or not directory.exists():
+                    continue
+                if [entry.name for entry in directory.iterdir()] == ["__pycache__"]:
+                    shutil.rmtree(directory / "__pycache__")
+                if not any(directory.iterdir()):
+                    directory.rmdir()
+        except OSError as e:
+            logger.debug(f"In-process uninstall of {package} failed: {e}")
+            return False
+        logger.debug(f"Removed {package} from {site_packages}")
+        return True
+
+    def _get_install_command_many(self, specifiers: List[str], update_manifest: bool = False, no_deps: bool = False) -> List[str]:
         # PHASE 2: PERSISTENT UPDATE
         if update_manifest:
             # Poetry Priority
             if self.has_poetry and self.is_poetry_project:
                 # 'poetry add' updates pyproject.toml and installs
-                return ["poetry", "add", specifier]
+                return ["poetry", "add", *specifiers]
             
             # UV Priority
             if self.has_uv and (self.is_uv_project or not self.is_poetry_project):
-                return ["uv", "add", specifier]
+                return ["uv", "add", *specifiers]
 
         # PHASE 1: TEMPORARY TRIAL (Env Only)
+        flags = ["--no-deps"] if no_deps else []
         if self.has_uv:
             # 'uv pip install' updates venv without touching manifest
-            return ["uv", "pip", "install", specifier]
+            return ["uv", "pip", "install", *flags, *specifiers]
             
         # Standard fallback
-        return ["python3", "-m", "pip", "install", specifier]
+        return ["python3", "-m", "pip", "install", *flags, *specifiers]
+
+    def _get_check_command(self) -> List[str]:
+        if self.has_uv:
+            return ["uv", "pip", "check"]
+        return ["python3", "-m", "pip", "check"]
+
+    def _check_problems(self) -> Optional[Set[str]]:
+        """
+        Runs 'pip check' and returns the conflicts it reports, one per line (empty when clean).
+        None means the check itself could not run.
+        """
+        try:
+            result = subprocess.run(
+                self._get_check_command(),
+                cwd=self.project_root,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=self._child_env,
+                timeout=self.timeout
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.debug(f"Dependency check could not run: {e}")
+            return None
+        if result.returncode == 0:
+            return set()
+        lines = {line.strip() for line in result.stdout.decode("utf-8", errors="replace").splitlines() if line.strip()}
+        return lines or {f"exit status {result.returncode}"}
 
-    def _get_uninstall_command(self, package: str) -> List[str]:
-        if self.has_uv and self.is_uv_project:
+    def _get_uninstall_command(self, package: str, update_manifest: bool = True) -> List[str]:
+        if self.has_uv and self.is_uv_project and update_manifest:
             return ["uv", "remove", package]
             
         if self.has_uv:
@@ -67,19 +322,108 @@ class PackageManager:
             
         return ["python3", "-m", "pip", "uninstall", "-y", package]
 
-    def _run(self, cmd: List[str]) -> bool:
-        logger.debug(f"Running command: {' '.join(cmd)}")
+    def _timeout_for(self, update_manifest: bool) -> Optional[int]:
+        return None if update_manifest else self.timeout
+
+    def _run(self, cmd: List[str], timeout: Optional[int] = None) -> bool:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Running command: {shlex.join(cmd)}")
+        # Capture output to avoid cluttering TUI, unless debug.
+        # stderr goes to a temp file rather than a pipe nobody drains: a chatty installer
+        # cannot block on a full pipe, and the text is only read back when the command failed.
+        # Keep preexec_fn / user / group arguments out of installer launches: without them CPython
+        # spawns via vfork() on Linux, which does not copy the parent's page tables. (posix_spawn
+        # itself would additionally need close_fds=False and no cwd, so it is not pursued.)
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                subprocess.check_call(
+                    cmd,
+                    cwd=self.project_root,
+                    stdout=subprocess.DEVNULL,
+                    stderr=stderr,
+                    env=self._child_env,
+                    timeout=timeout
+                )
+                return True
+            except subprocess.TimeoutExpired as e:
+                logger.error(f"Command timed out after {e.timeout}s: {shlex.join(cmd)}")
+                return False
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Command failed: {e}")
+                stderr.seek(0)
+                output = stderr.read()
+                if output:
+                     logger.error(f"Stderr: {output.decode('utf-8', errors='ignore')}")
+                return False
+
+    async def _arun(self, cmd: List[str], timeout: Optional[int] = None) -> bool:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Running command: {shlex.join(cmd)}")
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=self.project_root,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            env=self._child_env
+        )
+        # communicate() drains stderr while waiting, so a chatty installer cannot fill the pipe and block
         try:
-            # Capture output to avoid cluttering TUI, unless debug
-            subprocess.check_call(
-                cmd, 
-                cwd=self.project_root,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE
-            )
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            logger.error(f"Command timed out after {timeout}s: {shlex.join(cmd)}")
+            return False
+        if proc.returncode != 0:
+            logger.error(f"Command failed: {subprocess.CalledProcessError(proc.returncode, cmd)}")
+            if stderr:
+                 logger.error(f"Stderr: {stderr.decode('utf-8', errors='ignore')}")
+            return False
+        return True
+
+
+class InstallSession:
+    """
+    Queues installs and flushes them through PackageManager.install_many, so the
+    installer's startup and environment scan are paid once per batch instead of once
+    per package. uv has no long-lived server mode to reuse instead.
+    A batch that fails is retried one package at a time; the packages that still fail
+    are collected in `failed`.
+    """
+
+    def __init__(self, manager: PackageManager, update_manifest: bool = False, batch_size: int = 8):
+        self.manager = manager
+        self.update_manifest = update_manifest
+        self.batch_size = batch_size
+        self.failed: List[Tuple[str, Optional[str]]] = []
+        self._pending: List[Tuple[str, Optional[str]]] = []
+
+    def __enter__(self) -> "InstallSession":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+        else:
+            self._pending.clear()
+
+    def install(self, package: str, version: Optional[str] = None) -> None:
+        """Queues an install; it runs when the batch is full or the session ends."""
+        self._pending.append((package, version))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> bool:
+        """Installs everything queued so far. Returns True if every package installed."""
+        batch, self._pending = self._pending, []
+        if not batch or self.manager.install_many(batch, update_manifest=self.update_manifest):
             return True
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Command failed: {e}")
-            if e.stderr:
-                 logger.error(f"Stderr: {e.stderr.decode('utf-8', errors='ignore')}")
+        if len(batch) == 1:
+            self.failed.extend(batch)
             return False
+        # The resolver rejects the whole batch when any one pin conflicts; find the culprits
+        logger.info("Batch install failed, retrying packages individually...")
+        for package, version in batch:
+            if not self.manager.install(package, version, update_manifest=self.update_manifest):
+                self.failed.append((package, version))
+        return False
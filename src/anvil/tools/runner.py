@@ -1,48 +1,345 @@
+import importlib
+import importlib.util
+import logging
+import os
+import shlex
+import signal
 import subprocess
-from typing import List, Tuple
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from importlib import metadata
+from types import ModuleType
+from typing import BinaryIO, List, Literal, Optional, Sequence, Tuple, Union
 from pathlib import Path
+from anvil.core.env import EnvironmentChecker
 from anvil.core.logging import get_logger
+from anvil.tools._proc import trimmed_env, which
 
 logger = get_logger("tools.runner")
 
+TestMode = Literal["full", "lf", "ff", "affected"]
+
+# pytest flags per run_tests mode; "affected" needs pytest-testmon in the project's env
+_MODE_ARGS = {
+    "full": [],
+    "lf": ["--lf"],
+    "ff": ["--ff"],
+    "affected": ["--testmon"],
+}
+
+# Modules a forked child keeps when it runs pytest in-process; everything else
+# (outside the stdlib) is re-imported so freshly installed versions are picked up
+_KEEP_MODULES = ("pytest", "_pytest", "pluggy", "iniconfig", "anvil")
+
+
+def _forget_third_party_modules() -> None:
+    for name in list(sys.modules):
+        top = name.partition(".")[0]
+        if top not in sys.stdlib_module_names and top not in _KEEP_MODULES:
+            del sys.modules[name]
+    importlib.invalidate_caches()
+
+
+def _kill_process_group(pid: int) -> None:
+    """SIGKILLs the process group a test run leads, so its xdist workers die with it."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # The child had not become a group leader yet (or is already gone)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+# Output kept in memory for a passing run; callers only look at the summary at the end
+TAIL_BYTES = 4096
+
+
+class _OutputCollector:
+    """
+    Drains a child's output on a background thread.
+    Only the last TAIL_BYTES stay in memory; the full log is spooled to a temp file
+    and read back only when the run failed.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._tail: deque = deque()
+        self._tail_size = 0
+        self._spool = tempfile.TemporaryFile()
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def _consume(self) -> None:
+        debug = logger.isEnabledFor(logging.DEBUG)
+        with self._stream:
+            for line in self._stream:
+                if debug:
+                    logger.debug(f"[pytest] {line.decode('utf-8', errors='replace').rstrip()}")
+                self._spool.write(line)
+                self._tail.append(line)
+                self._tail_size += len(line)
+                while self._tail_size > TAIL_BYTES and len(self._tail) > 1:
+                    self._tail_size -= len(self._tail.popleft())
+
+    def join(self) -> None:
+        self._thread.join()
+
+    def output(self, full: bool) -> str:
+        """Returns the whole log when full is True, otherwise just the tail."""
+        if full:
+            self._spool.seek(0)
+            data = self._spool.read()
+        else:
+            data = b"".join(self._tail)
+        self._spool.close()
+        return data.decode("utf-8", errors="replace")
+
+
 class TestRunner:
     """Runs project tests to verify upgrades."""
-    
-    def __init__(self, project_root: Path):
+
+    # pytest imported once per process and inherited by every forked run
+    _pytest: Optional[ModuleType] = None
+
+    def __init__(self, project_root: Path, parallelism: Union[int, str, None] = "auto", in_process: bool = False):
+        """
+        :param parallelism: Worker count passed to pytest-xdist as '-n' ("auto" = one per CPU).
+                            None runs tests in a single process.
+        :param in_process: Run pytest in a forked copy of this process when the project uses
+                           Anvil's own interpreter, skipping interpreter startup. Only valid for
+                           pure-Python upgrades: compiled extensions already loaded here (e.g.
+                           pydantic_core, orjson) cannot be unloaded, so the child would test
+                           the old binary.
+        """
         self.project_root = project_root
-        
-    def run_tests(self) -> Tuple[bool, str]:
+        self.parallelism = parallelism
+        checker = EnvironmentChecker(str(project_root))
+        # <venv>/lib/pythonX.Y/site-packages -> <venv>/bin/python
+        self._venv_python = checker.site_packages.parents[2] / "bin" / "python" if checker.site_packages else None
+        self._pytest_cmd = self._detect_cmd(checker)
+        # Plugins must be installed in the interpreter that runs pytest, not just somewhere
+        self.has_xdist = self._launcher_has(checker, "pytest-xdist")
+        self.has_testmon = self._launcher_has(checker, "pytest-testmon")
+        self.in_process = in_process and self._can_run_in_process()
+        # Only LS_COLORS is dropped: the project's tests may rely on anything else (PYTHONPATH included)
+        self._child_env = trimmed_env("LS_COLORS")
+
+    def _detect_cmd(self, checker: EnvironmentChecker) -> Optional[List[str]]:
+        """
+        Resolves the launcher once instead of probing each command via FileNotFoundError.
+        With a project venv its own interpreter is launched (even when the venv is not
+        activated), so the pytest check and the run see the same packages. An interpreter
+        known to lack pytest is skipped.
+        """
+        if checker.site_packages:
+            if self._venv_python.exists() and self._project_has(checker, "pytest"):
+                return [str(self._venv_python), "-m", "pytest"]
+        elif which("python3") and self._python3_has_pytest():
+            return ["python3", "-m", "pytest"]
+        if which("pytest"):
+            return ["pytest"]
+        return None
+
+    @staticmethod
+    def _is_own_interpreter(python: str = "python3") -> bool:
+        """True when the interpreter (a path, or a name on PATH) belongs to the environment Anvil itself runs in."""
+        python_path = Path(which(python) or python).absolute()
+        return python_path.parent.parent.resolve() == Path(sys.prefix).resolve()
+
+    @staticmethod
+    def _project_has(checker: EnvironmentChecker, name: str) -> bool:
+        """
+        Looks only at the project venv's site-packages: get_installed_version would
+        also find the package in Anvil's own environment.
+        """
+        return next(iter(metadata.distributions(name=name, path=[str(checker.site_packages)])), None) is not None
+
+    def _launcher_has(self, checker: EnvironmentChecker, name: str) -> bool:
+        """
+        Whether the interpreter _detect_cmd chose has the given pytest plugin. Only the project
+        venv's interpreter and Anvil's own can be inspected; for anything else (a bare 'pytest'
+        script, some other python3) the plugin is treated as missing, since pytest rejects
+        '-n' / '--testmon' it does not know.
+        """
+        if not self._pytest_cmd or self._pytest_cmd[1:] != ["-m", "pytest"]:
+            return False
+        if checker.site_packages:
+            return self._project_has(checker, name)
+        if self._is_own_interpreter():
+            return checker.get_installed_version(name) is not None
+        return False
+
+    def _python3_has_pytest(self) -> bool:
+        if self._is_own_interpreter():
+            return importlib.util.find_spec("pytest") is not None
+        # Some other interpreter: let the launch decide
+        return True
+
+    def _can_run_in_process(self) -> bool:
+        """
+        pytest can run in a forked copy of this process only when the project would be
+        tested with this very interpreter; otherwise the subprocess path is used.
+        """
+        if not hasattr(os, "fork") or not self._pytest_cmd or self._pytest_cmd[1:] != ["-m", "pytest"]:
+            return False
+        if not self._is_own_interpreter(self._pytest_cmd[0]):
+            return False
+        if TestRunner._pytest is None:
+            try:
+                import pytest
+            except ImportError:
+                return False
+            TestRunner._pytest = pytest
+        return True
+
+    def _pytest_args(self, mode: TestMode = "full") -> List[str]:
+        # -x: an upgrade check only needs to know whether anything broke
+        args = ["-q", "--no-header", "-x"]
+        if self.has_xdist and self.parallelism is not None:
+            args += ["-n", str(self.parallelism)]
+        if mode == "affected" and not self.has_testmon:
+            logger.debug("pytest-testmon is not installed, running the full suite")
+            mode = "full"
+        return args + _MODE_ARGS[mode]
+
+    def run_tests(self, mode: TestMode = "full", extra_args: Sequence[str] = (), with_packages: Sequence[str] = ()) -> Tuple[bool, str]:
         """
         Runs tests and returns (success, output).
-        Default: 'pytest' then 'python -m pytest'.
-        """
-        commands_to_try = [
-            ["python3", "-m", "pytest"],
-            ["pytest"]
-        ]
-        
-        for cmd in commands_to_try:
-            logger.debug(f"Running tests with: {' '.join(cmd)}")
+        Default: '<venv>/bin/python -m pytest' when the project has a venv, else
+        'python3 -m pytest', else 'pytest' from PATH.
+        With in_process=True and that interpreter being Anvil's own, pytest runs in a
+        forked child instead.
+        Uses pytest-xdist ('-n <parallelism>') when the project has it installed; the
+        project's fixtures must then be xdist-safe (e.g. shared files created via
+        tmp_path_factory rather than fixed paths). Pass parallelism=None otherwise.
+        :param mode: "full" runs everything; "lf" / "ff" re-run (or run first) the tests that
+                     failed last time; "affected" runs only tests whose code paths changed
+                     (pytest-testmon, falls back to "full" when not installed).
+        :param extra_args: Appended to the pytest command line.
+        :param with_packages: Requirement specifiers layered over the project's environment for
+                              this run only, via 'uv run --with' (requires uv), on top of the
+                              project's venv interpreter. The venv itself is left untouched.
+        """
+        if with_packages:
+            if not which("uv"):
+                return False, "Could not launch uv. Is it installed?"
+            overlay = [arg for spec in with_packages for arg in ("--with", spec)]
+            # Without --python, uv may pick whichever interpreter it finds first
+            interpreter = ["--python", str(self._venv_python)] if self._venv_python else []
+            launcher = ["uv", "run", "--no-project", *interpreter, *overlay, "python", "-m", "pytest"]
+        elif self._pytest_cmd is None:
+            return False, "Could not launch pytest. Is it installed?"
+        else:
+            launcher = self._pytest_cmd
+
+        args = [*self._pytest_args(mode), *extra_args]
+        cmd = [*launcher, *args]
+        # fork() only copies the calling thread; locks held by other threads would stay locked in the child
+        forked = self.in_process and not with_packages and threading.active_count() == 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Running tests {'in-process' if forked else 'with'}: {shlex.join(cmd)}")
+        try:
+            if forked:
+                returncode, output = self._run_forked(args, timeout=300)
+            else:
+                returncode, output = self._stream(cmd, timeout=300) # 5 min timeout
+        except FileNotFoundError as e:
+            # PATH changed since construction (the launcher is cached)
+            logger.debug(f"Test command failed to launch: {e}")
+            return False, f"Could not launch {cmd[0]}. Is it installed?"
+        except subprocess.TimeoutExpired as e:
+            logger.warning(f"Tests timed out after {e.timeout}s")
+            return False, f"Tests timed out after {e.timeout}s"
+
+        success = returncode == 0
+        if success:
+            logger.info("Tests PASSED ✅")
+        else:
+            logger.warning("Tests FAILED ❌")
+
+        return success, output
+
+    def _run_forked(self, args: List[str], timeout: int) -> Tuple[int, str]:
+        """
+        Runs pytest.main(args) in a forked child, skipping interpreter startup and the
+        pytest import. The child's stdout/stderr are collected through a pipe.
+        """
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 3  # pytest's INTERNAL_ERROR
             try:
-                result = subprocess.run(
-                    cmd, 
-                    cwd=self.project_root, 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=300 # 5 min timeout
-                )
-                success = result.returncode == 0
-                output = result.stdout + "\n" + result.stderr
-                
-                if success:
-                    logger.info("Tests PASSED ✅")
-                else:
-                    logger.warning("Tests FAILED ❌")
-                    
-                return success, output
-                
-            except (FileNotFoundError, subprocess.TimeoutExpired) as e:
-                logger.debug(f"Test command failed to launch/complete: {e}")
-                continue
-                
-        return False, "Could not launch pytest. Is it installed?"
+                # Own process group, so a timeout can take xdist workers down with the child
+                os.setsid()
+                os.environ.clear()
+                os.environ.update(self._child_env)
+                os.close(read_fd)
+                os.dup2(write_fd, 1)
+                os.dup2(write_fd, 2)
+                os.chdir(self.project_root)
+                sys.path.insert(0, str(self.project_root))
+                _forget_third_party_modules()
+                code = int(TestRunner._pytest.main(args))
+            except BaseException:
+                # os._exit skips the interpreter's own traceback printing; fd 2 is the pipe
+                os.write(2, traceback.format_exc().encode("utf-8", errors="replace"))
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        collector = _OutputCollector(os.fdopen(read_fd, "rb"))
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                finished, status = os.waitpid(pid, os.WNOHANG)
+                if finished:
+                    break
+                if time.monotonic() > deadline:
+                    raise subprocess.TimeoutExpired(args, timeout)
+                time.sleep(0.05)
+        except BaseException:
+            # Timeout or Ctrl-C: the child's session does not receive the terminal's SIGINT
+            _kill_process_group(pid)
+            os.waitpid(pid, 0)
+            collector.join()
+            collector.output(full=False)
+            raise
+        collector.join()
+        returncode = os.waitstatus_to_exitcode(status)
+        return returncode, collector.output(full=returncode != 0)
+
+    def _stream(self, cmd: List[str], timeout: int) -> Tuple[int, str]:
+        """Runs cmd with stderr merged into stdout, consuming output line by line as it is produced."""
+        # No preexec_fn, so CPython can spawn via vfork() (see PackageManager._run).
+        # A new session puts pytest and its xdist workers in one process group.
+        proc = subprocess.Popen(
+            cmd,
+            cwd=self.project_root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=self._child_env,
+            start_new_session=True
+        )
+        collector = _OutputCollector(proc.stdout)
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except BaseException:
+            # Timeout or Ctrl-C: the child's session does not receive the terminal's SIGINT
+            if hasattr(os, "killpg"):
+                _kill_process_group(proc.pid)
+            else:
+                proc.kill()
+            proc.wait()
+            collector.join()
+            collector.output(full=False)
+            raise
+        collector.join()
+        return returncode, collector.output(full=returncode != 0)
@@ -0,0 +1,21 @@
+"""
+Shared pytest fixtures
+"""
+import pytest
+
+# Import the agent modules once at collection time so tests that import them
+# lazily inside their bodies find them already in sys.modules
+from anvil.agent import graph as _graph
+from anvil.agent.nodes import analyze as _analyze  # noqa: F401
+
+
+@pytest.fixture(scope="session")
+def compiled_graph():
+    """The compiled upgrade workflow, built once per test session."""
+    return _graph.build_upgrade_graph()
+
+
+@pytest.fixture
+def no_llm(mocker):
+    """Runs the analysis code paths as if no LLM provider were configured."""
+    return mocker.patch("anvil.agent.brain.get_llm", return_value=None)
@@ -3,7 +3,9 @@ Unit tests for LangGraph nodes
 """
 import pytest
 from pathlib import Path
+from unittest.mock import patch
 from anvil.agent.state import UpgradeWorkflowState, PackageUpgradeState
+from anvil.retrievers.pypi import PyPIRetriever
 from anvil.agent.nodes import (
     scan_node,
     select_node,
@@ -16,17 +18,12 @@ from anvil.agent.nodes import (
 )
 
 
-class TestScanNode:
-    """Test scan_node functionality"""
-
-    def test_scan_node_basic(self, tmp_path):
-        """Test that scan_node processes dependencies correctly"""
-        # Create a simple requirements.txt
-        req_file = tmp_path / "requirements.txt"
-        req_file.write_text("requests==2.30.0\nrich==13.0.0\n")
-
+@pytest.fixture
+def make_state():
+    """Factory for UpgradeWorkflowState dicts; tests override only the fields they need."""
+    def _make_state(**overrides) -> UpgradeWorkflowState:
         state: UpgradeWorkflowState = {
-            "project_root": str(tmp_path),
+            "project_root": "/tmp",
             "dependencies": [],
             "dashboard_data": [],
             "selected_packages": [],
@@ -38,6 +35,43 @@ class TestScanNode:
             "phase": "scan",
             "errors": []
         }
+        state.update(overrides)
+        return state
+    return _make_state
+
+
+@pytest.fixture
+def make_pkg_state():
+    """Factory for PackageUpgradeState; defaults describe a pending requests 2.30.0 -> 2.31.0 upgrade."""
+    def _make_pkg_state(**overrides) -> PackageUpgradeState:
+        base = dict(
+            name="requests",
+            current_version="2.30.0",
+            target_version="2.31.0",
+            changelog=None,
+            assessment=None,
+            approved=False,
+            installed=False,
+            tests_passed=None,
+            committed=False,
+            error=None
+        )
+        base.update(overrides)
+        return PackageUpgradeState(**base)
+    return _make_pkg_state
+
+
+class TestScanNode:
+    """Test scan_node functionality"""
+
+    def test_scan_node_basic(self, fs, monkeypatch, make_state):
+        """Test that scan_node processes dependencies correctly"""
+        # Create a simple requirements.txt on the in-memory filesystem
+        fs.create_file("/proj/requirements.txt", contents="requests==2.30.0\nrich==13.0.0\n")
+        # The fake filesystem has no CA bundle, so keep PyPI off the network
+        monkeypatch.setattr(PyPIRetriever, "get_latest_version", lambda self, name: "99.0.0")
+
+        state = make_state(project_root="/proj")
 
         result = scan_node(state)
 
@@ -45,19 +79,17 @@ class TestScanNode:
         assert result["phase"] == "select"
 
         # Verify it found dependencies
-        assert len(result["dependencies"]) > 0
-        assert len(result["dashboard_data"]) > 0
+        assert [dep.name for dep in result["dependencies"]] == ["requests", "rich"]
+        assert all(row["latest"] == "99.0.0" for row in result["dashboard_data"])
 
 
 class TestSelectNode:
     """Test select_node functionality"""
 
-    def test_select_node_no_selection(self):
+    def test_select_node_no_selection(self, make_state):
         """Test select_node when no packages are selected"""
-        state: UpgradeWorkflowState = {
-            "project_root": "/tmp",
-            "dependencies": [],
-            "dashboard_data": [
+        state = make_state(
+            dashboard_data=[
                 {
                     "name": "requests",
                     "range": ">=2.30.0",
@@ -66,15 +98,8 @@ class TestSelectNode:
                     "status": "OUTDATED"
                 }
             ],
-            "selected_packages": [],
-            "current_index": 0,
-            "packages": [],
-            "completed": [],
-            "failed": [],
-            "skipped": [],
-            "phase": "select",
-            "errors": []
-        }
+            phase="select"
+        )
 
         # Mock the TUI to return empty selection
         # Note: In real test, you'd mock DependencyDashboard
@@ -85,80 +110,46 @@ class TestSelectNode:
 class TestAnalyzeNode:
     """Test analyze_node functionality"""
 
-    def test_analyze_node_structure(self):
-        """Test that analyze_node has correct structure"""
-        pkg_state = PackageUpgradeState(
-            name="requests",
-            current_version="2.30.0",
-            target_version="2.31.0",
-            changelog=None,
-            assessment=None,
-            approved=False,
-            installed=False,
-            tests_passed=None,
-            committed=False,
-            error=None
-        )
+    @pytest.mark.parametrize("pkg_name", ["requests", "rich"])
+    def test_analyze_node_without_llm(self, tmp_path, mocker, no_llm, make_state, make_pkg_state, pkg_name):
+        """Test that analyze_node attaches the changelog and moves on to confirm"""
+        mocker.patch("anvil.agent.nodes.analyze.DependencyGraph")
+        mocker.patch("anvil.agent.nodes.analyze.ChangelogRetriever.get_changelog", return_value="Test changelog")
+        mocker.patch("anvil.agent.nodes.analyze.CodebaseScanner.scan_package_usage", return_value=[])
 
-        state: UpgradeWorkflowState = {
-            "project_root": "/tmp",
-            "dependencies": [],
-            "dashboard_data": [],
-            "selected_packages": ["requests"],
-            "current_index": 0,
-            "packages": [pkg_state],
-            "completed": [],
-            "failed": [],
-            "skipped": [],
-            "phase": "analyze",
-            "errors": []
-        }
+        pkg_state = make_pkg_state(name=pkg_name, current_version="1.0.0", target_version="1.1.0")
+        state = make_state(project_root=str(tmp_path), selected_packages=[pkg_name], packages=[pkg_state], phase="analyze")
+
+        result = analyze_node(state)
 
-        # Verify state structure is correct
-        assert len(state["packages"]) == 1
-        assert state["packages"][0]["name"] == "requests"
+        assert result["phase"] == "confirm"
+        assert result["packages"][0]["changelog"] == "Test changelog"
+        assert result["packages"][0]["assessment"] is None
+
+    def test_risk_assessor_skips_without_llm(self, no_llm):
+        """Test that the risk assessor degrades to no assessment without an LLM"""
+        from anvil.agent.brain import RiskAssessor
+
+        assessment = RiskAssessor().assess_changelog("requests", "2.30.0", "2.31.0", "Test changelog")
+
+        assert assessment is None
+        no_llm.assert_called_once_with()
 
 
 class TestConfirmNode:
     """Test confirm_node functionality"""
 
-    def test_confirm_node_skip(self, monkeypatch):
+    def test_confirm_node_skip(self, make_state, make_pkg_state):
         """Test confirm_node when user declines"""
-        # Mock Confirm.ask to return False
-        def mock_ask(prompt):
-            return False
-
         from rich.prompt import Confirm
-        monkeypatch.setattr(Confirm, "ask", mock_ask)
 
-        pkg_state = PackageUpgradeState(
-            name="requests",
-            current_version="2.30.0",
-            target_version="2.31.0",
-            changelog="Test changelog",
-            assessment=None,
-            approved=False,
-            installed=False,
-            tests_passed=None,
-            committed=False,
-            error=None
-        )
+        pkg_state = make_pkg_state(changelog="Test changelog")
 
-        state: UpgradeWorkflowState = {
-            "project_root": "/tmp",
-            "dependencies": [],
-            "dashboard_data": [],
-            "selected_packages": ["requests"],
-            "current_index": 0,
-            "packages": [pkg_state],
-            "completed": [],
-            "failed": [],
-            "skipped": [],
-            "phase": "confirm",
-            "errors": []
-        }
+        state = make_state(selected_packages=["requests"], packages=[pkg_state], phase="confirm")
 
-        result = confirm_node(state)
+        # Mock Confirm.ask to return False
+        with patch.object(Confirm, "ask", return_value=False):
+            result = confirm_node(state)
 
         assert result["phase"] == "next"
         assert "requests" in result["skipped"]
@@ -168,85 +159,41 @@ class TestConfirmNode:
 class TestGraphRouting:
     """Test graph routing logic"""
 
-    def test_route_after_select_with_packages(self):
-        """Test routing when packages are selected"""
+    @pytest.mark.parametrize("selected,expected", [
+        (["requests"], "analyze"),
+        ([], "done"),
+    ], ids=["with_packages", "no_packages"])
+    def test_route_after_select(self, make_state, selected, expected):
+        """Test routing after package selection"""
         from anvil.agent.graph import route_after_select
 
-        state: UpgradeWorkflowState = {
-            "project_root": "/tmp",
-            "dependencies": [],
-            "dashboard_data": [],
-            "selected_packages": ["requests"],
-            "current_index": 0,
-            "packages": [],
-            "completed": [],
-            "failed": [],
-            "skipped": [],
-            "phase": "select",
-            "errors": []
-        }
-
-        result = route_after_select(state)
-        assert result == "analyze"
-
-    def test_route_after_select_no_packages(self):
-        """Test routing when no packages selected"""
-        from anvil.agent.graph import route_after_select
+        state = make_state(selected_packages=selected, phase="select")
 
-        state: UpgradeWorkflowState = {
-            "project_root": "/tmp",
-            "dependencies": [],
-            "dashboard_data": [],
-            "selected_packages": [],
-            "current_index": 0,
-            "packages": [],
-            "completed": [],
-            "failed": [],
-            "skipped": [],
-            "phase": "select",
-            "errors": []
-        }
+        assert route_after_select(state) == expected
 
-        result = route_after_select(state)
-        assert result == "done"
-
-    def test_next_package_or_done(self):
+    @pytest.mark.parametrize("idx,pkgs,expected", [
+        (0, [{}, {}], "analyze"),  # More packages remaining
+        (1, [{}, {}], "done"),  # No more packages
+    ], ids=["more_packages", "last_package"])
+    def test_next_package_or_done(self, make_state, idx, pkgs, expected):
         """Test advancing to next package"""
         from anvil.agent.graph import next_package_or_done
 
-        # Test with more packages remaining
-        state: UpgradeWorkflowState = {
-            "project_root": "/tmp",
-            "dependencies": [],
-            "dashboard_data": [],
-            "selected_packages": ["pkg1", "pkg2"],
-            "current_index": 0,
-            "packages": [{}, {}],  # Two packages
-            "completed": [],
-            "failed": [],
-            "skipped": [],
-            "phase": "next",
-            "errors": []
-        }
-
-        result = next_package_or_done(state)
-        assert result == "analyze"
+        state = make_state(
+            selected_packages=["pkg1", "pkg2"],
+            current_index=idx,
+            packages=pkgs,
+            phase="next"
+        )
 
-        # Test with no more packages
-        state["current_index"] = 1
-        result = next_package_or_done(state)
-        assert result == "done"
+        assert next_package_or_done(state) == expected
 
 
 class TestGraphCompilation:
     """Test that the graph compiles correctly"""
 
-    def test_build_upgrade_graph(self):
+    def test_build_upgrade_graph(self, compiled_graph):
         """Test that build_upgrade_graph returns a compiled graph"""
-        from anvil.agent.graph import build_upgrade_graph
-
-        graph = build_upgrade_graph()
-
         # Verify it's a compiled graph (has invoke method)
-        assert hasattr(graph, "invoke")
-        assert hasattr(graph, "stream")
+        assert hasattr(compiled_graph, "invoke")
+        assert hasattr(compiled_graph, "stream")
@@ -0,0 +1,615 @@
+import asyncio
+import io
+import logging
+import os
+import subprocess
+import sys
+import time
+from importlib import metadata
+import pytest
+from anvil.tools import _proc
+from anvil.tools._proc import invalidate_which_cache
+from anvil.tools import runner as runner_module
+from anvil.tools.package import InstallSession, PackageManager, _detect_project_kind, _installer_cache_env
+
+
+@pytest.fixture(autouse=True)
+def _clear_tool_caches(monkeypatch):
+    # EnvironmentChecker would otherwise pick up the venv the suite itself runs in
+    monkeypatch.delenv("VIRTUAL_ENV", raising=False)
+    invalidate_which_cache()
+    _detect_project_kind.cache_clear()
+    yield
+    invalidate_which_cache()
+    _detect_project_kind.cache_clear()
+
+
+@pytest.mark.parametrize("files, expected", [
+    ({}, (False, False)),
+    ({"uv.lock": ""}, (True, False)),
+    ({"poetry.lock": ""}, (False, True)),
+    ({"pyproject.toml": "[tool.poetry]\nname = 'x'\n"}, (False, True)),
+    ({"pyproject.toml": "[project]\nname = 'x'\n"}, (False, False)),
+    ({"pyproject.toml": "not = [valid"}, (False, False)),
+], ids=["empty", "uv-lock", "poetry-lock", "poetry-table", "pep621", "invalid-toml"])
+def test_package_manager_detects_project_kind(tmp_path, files, expected):
+    for name, content in files.items():
+        (tmp_path / name).write_text(content)
+
+    pm = PackageManager(tmp_path)
+
+    assert (pm.is_uv_project, pm.is_poetry_project) == expected
+
+
+def test_detect_project_kind_tolerates_vanished_pyproject(tmp_path):
+    # pyproject.toml was stat()ed, then deleted before it could be read
+    assert _detect_project_kind(str(tmp_path), 123.0, False, False) == (False, False)
+
+
+def test_detect_project_kind_rereads_edited_pyproject(tmp_path):
+    pyproject = tmp_path / "pyproject.toml"
+    pyproject.write_text("[project]\nname = 'x'\n")
+    assert _detect_project_kind(str(tmp_path), 1.0, False, False) == (False, False)
+
+    pyproject.write_text("[tool.poetry]\nname = 'x'\n")
+    assert _detect_project_kind(str(tmp_path), 1.0, False, False) == (False, False)  # same mtime: cached
+    assert _detect_project_kind(str(tmp_path), 2.0, False, False) == (False, True)
+
+
+@pytest.fixture
+def pip_pm(tmp_path):
+    """A PackageManager that builds plain 'python3 -m pip' commands."""
+    pm = PackageManager(tmp_path)
+    pm.has_uv = pm.has_poetry = False
+    return pm
+
+
+def _check(returncode, output=""):
+    return subprocess.CompletedProcess(["pip", "check"], returncode, stdout=output.encode())
+
+
+def test_no_deps_install_ignores_conflicts_that_predate_it(pip_pm, mocker):
+    conflict = "old 1.0 has requirement dep<2, but you have dep 3.0."
+    run = mocker.patch("subprocess.run", side_effect=[_check(1, conflict), _check(1, conflict)])
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.install("pkg", "2.0", no_deps=True)
+
+    assert run.call_count == 2
+    assert [c.args[0] for c in check_call.call_args_list] == [["python3", "-m", "pip", "install", "--no-deps", "pkg==2.0"]]
+
+
+def test_no_deps_install_falls_back_on_new_conflicts(pip_pm, mocker):
+    mocker.patch("subprocess.run", side_effect=[_check(0), _check(1, "pkg 2.0 requires dep, which is not installed.")])
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.install("pkg", "2.0", no_deps=True)
+
+    assert [c.args[0] for c in check_call.call_args_list] == [
+        ["python3", "-m", "pip", "install", "--no-deps", "pkg==2.0"],
+        ["python3", "-m", "pip", "install", "pkg==2.0"],
+    ]
+
+
+def test_no_deps_install_logs_why_it_falls_back(pip_pm, mocker, caplog):
+    caplog.set_level("INFO", logger="anvil")
+    mocker.patch("subprocess.run", return_value=_check(0))
+    mocker.patch("subprocess.check_call", side_effect=[subprocess.CalledProcessError(1, "pip"), None])
+
+    assert pip_pm.install("pkg", "2.0", no_deps=True)
+
+    assert "--no-deps install failed" in caplog.text
+    assert "Dependency check failed" not in caplog.text
+
+
+def test_no_deps_is_ignored_for_manifest_updates(pip_pm, mocker):
+    run = mocker.patch("subprocess.run")
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.install("pkg", "2.0", update_manifest=True, no_deps=True)
+
+    run.assert_not_called()
+    assert check_call.call_args.args[0] == ["python3", "-m", "pip", "install", "pkg==2.0"]
+
+
+def _own_python3(name):
+    return os.path.join(sys.prefix, "bin", name) if name == "python3" else None
+
+
+def _wait_until_dead(pid, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().split(") ")[1].startswith("Z"):
+                    return True
+        except FileNotFoundError:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+# Starts a long-running grandchild (standing in for an xdist worker), records its pid and hangs
+SPAWN_WORKER = (
+    "import subprocess, sys, time\n"
+    "worker = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+    "open(sys.argv[1], 'w').write(str(worker.pid))\n"
+    "time.sleep(60)\n"
+)
+
+
+def test_runner_forks_only_when_asked(tmp_path, monkeypatch):
+    monkeypatch.setattr(runner_module, "which", _own_python3)
+
+    assert not runner_module.TestRunner(tmp_path).in_process
+    assert runner_module.TestRunner(tmp_path, in_process=True).in_process
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="POSIX process groups")
+def test_stream_timeout_kills_the_whole_process_group(tmp_path):
+    pid_file = tmp_path / "worker.pid"
+    runner = runner_module.TestRunner(tmp_path)
+
+    started = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner._stream([sys.executable, "-c", SPAWN_WORKER, str(pid_file)], timeout=1)
+
+    # A surviving worker would also hold the output pipe open until its sleep ends
+    assert time.monotonic() - started < 30
+    assert _wait_until_dead(int(pid_file.read_text()))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="POSIX fork")
+def test_forked_timeout_kills_the_whole_process_group(tmp_path, monkeypatch):
+    pid_file = tmp_path / "worker.pid"
+
+    class FakePytest:
+        @staticmethod
+        def main(args):
+            # Runs in the forked child
+            subprocess.run([sys.executable, "-c", SPAWN_WORKER, str(pid_file)])
+            return 0
+
+    monkeypatch.setattr(runner_module.TestRunner, "_pytest", FakePytest)
+    runner = runner_module.TestRunner(tmp_path)
+
+    started = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner._run_forked([], timeout=1)
+
+    assert time.monotonic() - started < 30
+    assert _wait_until_dead(int(pid_file.read_text()))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="POSIX fork")
+def test_forked_child_uses_the_trimmed_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("LS_COLORS", "di=01;34")
+    seen = tmp_path / "env"
+
+    class FakePytest:
+        @staticmethod
+        def main(args):
+            seen.write_text(os.environ.get("LS_COLORS", "<unset>"))
+            return 0
+
+    monkeypatch.setattr(runner_module.TestRunner, "_pytest", FakePytest)
+
+    assert runner_module.TestRunner(tmp_path)._run_forked([], timeout=10) == (0, "")
+    assert seen.read_text() == "<unset>"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="POSIX fork")
+def test_forked_child_reports_a_crashing_pytest(tmp_path, monkeypatch):
+    class FakePytest:
+        @staticmethod
+        def main(args):
+            raise RuntimeError("plugin exploded")
+
+    monkeypatch.setattr(runner_module.TestRunner, "_pytest", FakePytest)
+
+    code, output = runner_module.TestRunner(tmp_path)._run_forked([], timeout=10)
+
+    assert code == 3
+    assert "RuntimeError: plugin exploded" in output
+
+
+def _site_packages(project_root):
+    site_packages = project_root / ".venv" / "lib" / "python3.11" / "site-packages"
+    site_packages.mkdir(parents=True, exist_ok=True)
+    return site_packages
+
+
+def _install_fake_dist(site_packages, name, version, files=None, record_extra=()):
+    """Writes a minimal installed distribution: its files, METADATA and a RECORD listing both."""
+    files = files if files is not None else {f"{name}/__init__.py": ""}
+    dist_info = site_packages / f"{name}-{version}.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n")
+    for rel, content in files.items():
+        (site_packages / rel).parent.mkdir(parents=True, exist_ok=True)
+        (site_packages / rel).write_text(content)
+    record = [*files, *record_extra, f"{dist_info.name}/METADATA", f"{dist_info.name}/RECORD"]
+    (dist_info / "RECORD").write_text("".join(f"{line},,\n" for line in record))
+    return dist_info
+
+
+def test_uninstall_removes_record_files_in_process(pip_pm, tmp_path, mocker):
+    site_packages = _site_packages(tmp_path)
+    _install_fake_dist(site_packages, "demo", "1.0", files={
+        "demo/__init__.py": "",
+        "demo/sub/mod.py": "",
+        "demo/__pycache__/__init__.cpython-311.pyc": "",
+    })
+    (site_packages / "demo" / "sub" / "__pycache__").mkdir()
+    _install_fake_dist(site_packages, "other", "1.0")
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.uninstall("demo")
+
+    check_call.assert_not_called()
+    assert sorted(p.name for p in site_packages.iterdir()) == ["other", "other-1.0.dist-info"]
+
+
+def test_uninstall_refuses_record_paths_outside_site_packages(pip_pm, tmp_path, mocker):
+    site_packages = _site_packages(tmp_path)
+    victim = tmp_path / "victim.txt"
+    victim.write_text("keep me")
+    _install_fake_dist(site_packages, "demo", "1.0", record_extra=["../../../../victim.txt"])
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.uninstall("demo")
+
+    assert victim.read_text() == "keep me"
+    assert (site_packages / "demo" / "__init__.py").exists()
+    assert check_call.call_args.args[0] == ["python3", "-m", "pip", "uninstall", "-y", "demo"]
+
+
+@pytest.mark.parametrize("update_manifest, expected", [
+    (False, ["uv", "pip", "uninstall", "demo"]),
+    (True, ["uv", "remove", "demo"]),
+])
+def test_uninstall_in_uv_projects_goes_through_uv(tmp_path, mocker, update_manifest, expected):
+    (tmp_path / "uv.lock").write_text("")
+    site_packages = _site_packages(tmp_path)
+    _install_fake_dist(site_packages, "demo", "1.0")
+    pm = PackageManager(tmp_path)
+    pm.has_uv = True
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pm.uninstall("demo", update_manifest=update_manifest)
+
+    assert check_call.call_args.args[0] == expected
+    assert (site_packages / "demo" / "__init__.py").exists()
+
+
+def test_install_skips_pins_the_project_venv_already_has(pip_pm, tmp_path, mocker):
+    _install_fake_dist(_site_packages(tmp_path), "demo", "1.0")
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.install("demo", "1.0.0")
+
+    check_call.assert_not_called()
+
+
+def test_install_ignores_packages_only_anvil_has(pip_pm, tmp_path, mocker):
+    # pytest is importable here, but the project's (empty) venv does not have it
+    _site_packages(tmp_path)
+    installed = metadata.version("pytest")
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.install("pytest", installed)
+
+    assert check_call.call_args.args[0] == ["python3", "-m", "pip", "install", f"pytest=={installed}"]
+
+
+def test_install_without_a_project_venv_installs_everything(pip_pm, mocker):
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.install("pytest", metadata.version("pytest"))
+
+    check_call.assert_called_once()
+
+
+def test_install_and_test_overlays_the_project_venv_interpreter(tmp_path, mocker):
+    _install_fake_dist(_site_packages(tmp_path), "pytest", "8.0.0")
+    pm = PackageManager(tmp_path)
+    pm.has_uv = True
+    mocker.patch.object(runner_module, "which", return_value="/usr/bin/uv")
+    stream = mocker.patch.object(runner_module.TestRunner, "_stream", return_value=(0, "1 passed"))
+    install = mocker.patch.object(pm, "install")
+
+    assert pm.install_and_test("demo", "2.0", test_args=["-x"]) == (True, "1 passed")
+
+    install.assert_not_called()
+    cmd = stream.call_args.args[0]
+    venv_python = str(tmp_path / ".venv" / "bin" / "python")
+    assert cmd[:5] == ["uv", "run", "--no-project", "--python", venv_python]
+    assert cmd[5:10] == ["--with", "demo==2.0", "python", "-m", "pytest"]
+    assert cmd[-1] == "-x"
+
+
+def test_install_and_test_without_uv_installs_first(pip_pm, mocker):
+    install = mocker.patch.object(pip_pm, "install", return_value=True)
+    run_tests = mocker.patch.object(runner_module.TestRunner, "run_tests", return_value=(False, "1 failed"))
+
+    assert pip_pm.install_and_test("demo", "2.0") == (False, "1 failed")
+
+    install.assert_called_once_with("demo", "2.0", no_deps=True)
+    run_tests.assert_called_once_with(extra_args=())
+
+
+def test_install_many_runs_the_installer_once(pip_pm, mocker):
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pip_pm.install_many([("a", "1.0"), ("b", None), ("c", "3.0")])
+
+    check_call.assert_called_once()
+    assert check_call.call_args.args[0] == ["python3", "-m", "pip", "install", "a==1.0", "b", "c==3.0"]
+
+
+def test_which_is_cached_until_invalidated(mocker):
+    lookup = mocker.patch("shutil.which", return_value="/usr/bin/uv")
+
+    assert _proc.which("uv") == _proc.which("uv") == "/usr/bin/uv"
+    assert lookup.call_count == 1
+
+    invalidate_which_cache()
+    _proc.which("uv")
+    assert lookup.call_count == 2
+
+
+def test_install_async_uses_the_same_command(pip_pm, mocker):
+    arun = mocker.patch.object(pip_pm, "_arun", return_value=True)
+
+    assert asyncio.run(pip_pm.install_async("demo", "1.0"))
+
+    assert arun.call_args.args[0] == ["python3", "-m", "pip", "install", "demo==1.0"]
+
+
+def test_install_async_skips_satisfied_pins(pip_pm, tmp_path, mocker):
+    _install_fake_dist(_site_packages(tmp_path), "demo", "1.0")
+    arun = mocker.patch.object(pip_pm, "_arun", return_value=True)
+
+    assert asyncio.run(pip_pm.install_async("demo", "1.0"))
+
+    arun.assert_not_called()
+
+
+def test_install_async_no_deps_falls_back_on_new_conflicts(pip_pm, mocker):
+    mocker.patch("subprocess.run", side_effect=[_check(0), _check(1, "demo 2.0 requires dep, which is not installed.")])
+    arun = mocker.patch.object(pip_pm, "_arun", return_value=True)
+
+    assert asyncio.run(pip_pm.install_async("demo", "2.0", no_deps=True))
+
+    assert [call.args[0] for call in arun.call_args_list] == [
+        ["python3", "-m", "pip", "install", "--no-deps", "demo==2.0"],
+        ["python3", "-m", "pip", "install", "demo==2.0"],
+    ]
+
+
+def test_output_collector_keeps_only_a_tail_unless_asked():
+    lines = [f"line {i}\n".encode() for i in range(2000)]
+
+    tail = runner_module._OutputCollector(io.BytesIO(b"".join(lines)))
+    tail.join()
+    kept = tail.output(full=False)
+    assert len(kept) <= runner_module.TAIL_BYTES
+    assert kept.endswith("line 1999\n")
+
+    full = runner_module._OutputCollector(io.BytesIO(b"".join(lines)))
+    full.join()
+    assert full.output(full=True) == b"".join(lines).decode()
+
+
+@pytest.mark.parametrize("code, full", [(0, False), (1, True)])
+def test_stream_returns_the_full_log_only_for_failures(tmp_path, code, full):
+    runner = runner_module.TestRunner(tmp_path)
+    script = f"import sys\nfor i in range(2000): print('line', i)\nsys.exit({code})"
+
+    returncode, output = runner._stream([sys.executable, "-c", script], timeout=30)
+
+    assert returncode == code
+    assert output.endswith("line 1999\n")
+    assert output.startswith("line 0\n") is full
+
+
+def test_run_logs_installer_stderr_only_on_failure(pip_pm, caplog):
+    assert pip_pm._run([sys.executable, "-c", "import sys; sys.stderr.write('quiet')"])
+    assert "quiet" not in caplog.text
+
+    assert not pip_pm._run([sys.executable, "-c", "import sys; sys.exit('boom')"])
+    assert "boom" in caplog.text
+
+
+def test_install_session_batches_installs(pip_pm, mocker):
+    install_many = mocker.patch.object(pip_pm, "install_many", return_value=True)
+
+    with pip_pm.session(batch_size=2) as session:
+        for name in ("a", "b", "c"):
+            session.install(name, "1.0")
+        assert install_many.call_count == 1
+
+    assert [call.args[0] for call in install_many.call_args_list] == [
+        [("a", "1.0"), ("b", "1.0")],
+        [("c", "1.0")],
+    ]
+    assert session.failed == []
+
+
+def test_install_session_retries_a_failed_batch_one_by_one(pip_pm, mocker):
+    mocker.patch.object(pip_pm, "install_many", side_effect=lambda batch, **_: len(batch) == 1 and batch[0][0] != "bad")
+
+    with pip_pm.session() as session:
+        for name in ("a", "bad", "c"):
+            session.install(name, "1.0")
+
+    assert session.failed == [("bad", "1.0")]
+
+
+def test_install_session_drops_queued_installs_on_error(pip_pm, mocker):
+    install_many = mocker.patch.object(pip_pm, "install_many")
+
+    with pytest.raises(RuntimeError):
+        with InstallSession(pip_pm) as session:
+            session.install("a", "1.0")
+            raise RuntimeError
+
+    install_many.assert_not_called()
+
+
+def test_run_tests_without_a_launcher(tmp_path):
+    runner = runner_module.TestRunner(tmp_path)
+    runner._pytest_cmd = None
+
+    assert runner.run_tests() == (False, "Could not launch pytest. Is it installed?")
+
+
+@pytest.mark.parametrize("mode, has_xdist, has_testmon, parallelism, expected", [
+    ("full", False, False, "auto", []),
+    ("full", True, False, "auto", ["-n", "auto"]),
+    ("full", True, False, 4, ["-n", "4"]),
+    ("full", True, False, None, []),
+    ("lf", False, False, "auto", ["--lf"]),
+    ("ff", False, False, "auto", ["--ff"]),
+    ("affected", False, True, "auto", ["--testmon"]),
+    ("affected", False, False, "auto", []),
+])
+def test_pytest_args(tmp_path, mode, has_xdist, has_testmon, parallelism, expected):
+    runner = runner_module.TestRunner(tmp_path, parallelism=parallelism)
+    runner.has_xdist, runner.has_testmon = has_xdist, has_testmon
+
+    assert runner._pytest_args(mode) == ["-q", "--no-header", "-x", *expected]
+
+
+def _venv_python(project_root):
+    venv_python = project_root / ".venv" / "bin" / "python"
+    venv_python.parent.mkdir(parents=True, exist_ok=True)
+    venv_python.touch()
+    return venv_python
+
+
+def test_runner_detects_xdist_and_testmon_in_the_project_venv(tmp_path):
+    site_packages = _site_packages(tmp_path)
+    _venv_python(tmp_path)
+    _install_fake_dist(site_packages, "pytest", "8.0.0")
+    _install_fake_dist(site_packages, "pytest_xdist", "3.5.0", files={"xdist/__init__.py": ""})
+
+    runner = runner_module.TestRunner(tmp_path)
+
+    assert runner.has_xdist and not runner.has_testmon
+
+
+def test_runner_ignores_venv_plugins_it_does_not_launch(tmp_path, mocker):
+    # No pytest in the venv, so the bare 'pytest' script from PATH runs instead
+    site_packages = _site_packages(tmp_path)
+    _venv_python(tmp_path)
+    _install_fake_dist(site_packages, "pytest_xdist", "3.5.0", files={"xdist/__init__.py": ""})
+    _install_fake_dist(site_packages, "pytest_testmon", "2.1.0", files={"testmon/__init__.py": ""})
+    mocker.patch.object(runner_module, "which", side_effect=lambda name: f"/usr/bin/{name}")
+
+    runner = runner_module.TestRunner(tmp_path)
+
+    assert runner._pytest_cmd == ["pytest"]
+    assert not runner.has_xdist and not runner.has_testmon
+    assert runner._pytest_args("affected") == ["-q", "--no-header", "-x"]
+
+
+def test_runner_skips_python3_without_pytest(tmp_path, mocker):
+    # The project's venv has no pytest, so 'python3 -m pytest' would fail to import it
+    _site_packages(tmp_path)
+    mocker.patch.object(runner_module, "which", side_effect=lambda name: f"/usr/bin/{name}")
+
+    assert runner_module.TestRunner(tmp_path)._pytest_cmd == ["pytest"]
+
+
+def test_runner_launches_the_project_venv_interpreter(tmp_path, mocker):
+    _install_fake_dist(_site_packages(tmp_path), "pytest", "8.0.0")
+    venv_python = _venv_python(tmp_path)
+    # python3 on PATH is some other interpreter; the venv is not activated
+    mocker.patch.object(runner_module, "which", side_effect=lambda name: f"/usr/bin/{name}")
+    runner = runner_module.TestRunner(tmp_path)
+    stream = mocker.patch.object(runner, "_stream", return_value=(0, "1 passed"))
+
+    assert runner.run_tests() == (True, "1 passed")
+
+    assert stream.call_args.args[0][:3] == [str(venv_python), "-m", "pytest"]
+
+
+def test_run_tests_appends_mode_and_extra_args(tmp_path, mocker):
+    runner = runner_module.TestRunner(tmp_path)
+    runner._pytest_cmd = ["python3", "-m", "pytest"]
+    runner.has_xdist = True
+    stream = mocker.patch.object(runner, "_stream", return_value=(1, "1 failed"))
+
+    assert runner.run_tests(mode="lf", extra_args=["tests/unit"]) == (False, "1 failed")
+
+    assert stream.call_args.args[0] == ["python3", "-m", "pytest", "-q", "--no-header", "-x", "-n", "auto", "--lf", "tests/unit"]
+
+
+def test_command_lines_are_formatted_only_for_debug_logs(pip_pm, tmp_path, mocker, caplog):
+    join = mocker.patch("shlex.join", return_value="cmd")
+    mocker.patch("subprocess.check_call")
+    runner = runner_module.TestRunner(tmp_path)
+    runner._pytest_cmd = ["python3", "-m", "pytest"]
+    mocker.patch.object(runner, "_stream", return_value=(0, ""))
+
+    caplog.set_level(logging.INFO, logger="anvil")
+    pip_pm._run(["pip", "--version"])
+    runner.run_tests()
+    join.assert_not_called()
+
+    caplog.set_level(logging.DEBUG, logger="anvil")
+    pip_pm._run(["pip", "--version"])
+    runner.run_tests()
+    assert join.call_count == 2
+
+
+def test_child_environments_are_trimmed(tmp_path, monkeypatch):
+    monkeypatch.setenv("LS_COLORS", "di=01;34")
+    monkeypatch.setenv("PYTHONPATH", "/anvil/src")
+    monkeypatch.setenv("ANVIL_TEST_MARKER", "1")
+
+    pm_env = PackageManager(tmp_path)._child_env
+    runner_env = runner_module.TestRunner(tmp_path)._child_env
+
+    assert "LS_COLORS" not in pm_env and "PYTHONPATH" not in pm_env
+    assert "LS_COLORS" not in runner_env
+    # The project's own tests may depend on PYTHONPATH
+    assert runner_env["PYTHONPATH"] == "/anvil/src"
+    assert pm_env["ANVIL_TEST_MARKER"] == runner_env["ANVIL_TEST_MARKER"] == "1"
+
+
+@pytest.mark.parametrize("env, expected", [
+    ({}, {}),
+    ({"ANVIL_CACHE_DIR": "/cache"}, {"UV_CACHE_DIR": "/cache/uv", "PIP_CACHE_DIR": "/cache/pip"}),
+    ({"ANVIL_CACHE_DIR": "/cache", "PIP_CACHE_DIR": "/pip"}, {"UV_CACHE_DIR": "/cache/uv"}),
+])
+def test_installer_cache_env(env, expected):
+    assert _installer_cache_env(env) == expected
+
+
+def test_package_manager_passes_cache_env_to_installers(tmp_path, monkeypatch, mocker):
+    monkeypatch.setenv("ANVIL_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("PIP_CACHE_DIR", raising=False)
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert PackageManager(tmp_path).install_many([("demo", None)])
+
+    assert check_call.call_args.kwargs["env"]["PIP_CACHE_DIR"] == str(tmp_path / "cache" / "pip")
+
+
+def test_run_times_out_stalled_installers(pip_pm):
+    started = time.monotonic()
+    assert not pip_pm._run([sys.executable, "-c", "import time; time.sleep(30)"], timeout=1)
+    assert time.monotonic() - started < 15
+
+
+@pytest.mark.parametrize("update_manifest, expected", [(False, 7), (True, None)])
+def test_only_trial_runs_are_timed_out(tmp_path, mocker, update_manifest, expected):
+    pm = PackageManager(tmp_path, timeout=7)
+    check_call = mocker.patch("subprocess.check_call")
+
+    assert pm.install("demo", "1.0", update_manifest=update_manifest)
+    assert pm.uninstall("demo", update_manifest=update_manifest)
+
+    assert [call.kwargs["timeout"] for call in check_call.call_args_list] == [expected, expected]